@@ -0,0 +1,74 @@
+#!/usr/bin/python
+"""
+Compare the otb and numpy backends of the band mode on the same scene: execution time and differences of the outputs.
+
+to be launched from the root of the repository:
+    python -m benchmarks.compare_backends -i <input_folder> -f S2-2A
+"""
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+import numpy as np
+from osgeo import gdal
+
+from meoss_libs.file_management import search_B4_B8, generate_output_file_name
+from meoss_libs.log_config import setup_logging
+from ndvi_calculation import ndvi_calculation_band
+
+logger = logging.getLogger('NDVI calculation')
+
+
+def run_backend(backend, img_format, nir, red, mask, output_directory, shape_file=None, threads=None):
+    """
+    Run the band mode with a backend and return the execution time and the output file.
+    """
+    start = time.perf_counter()
+    ndvi_calculation_band(img_format, nir, red, mask, output_directory, shape_file, backend=backend, threads=threads)
+    duration = time.perf_counter() - start
+
+    return duration, os.path.join(output_directory, generate_output_file_name(red, img_format, prefix='NDVI'))
+
+
+def compare_outputs(file1, file2):
+    """
+    Compare two NDVI images.
+
+    Returns:
+        dict: 'max_abs_diff' maximum absolute difference and 'nb_diff' number of different pixels.
+    """
+    array1 = gdal.Open(file1).ReadAsArray().astype(np.int32)
+    array2 = gdal.Open(file2).ReadAsArray().astype(np.int32)
+
+    if array1.shape != array2.shape:
+        raise ValueError(f"outputs have different sizes: {array1.shape} / {array2.shape}")
+
+    diff = np.abs(array1 - array2)
+    return {'max_abs_diff': int(diff.max()), 'nb_diff': int(np.count_nonzero(diff))}
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(prog='backends comparison', description='Compare otb and numpy backends of the band mode', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('-i', '--input-directory', dest='input_dir', default=os.path.join(os.getcwd(), '01_DATA'), help='Input images file directory.')
+    parser.add_argument('-f', '--format', choices=['S2-2A', 'S2-2A-ESA', 'S2-3A'], required=True, dest='format', help='Sentinel-2 level')
+    parser.add_argument('-shpdir', '--shapefile-directory', required=False, dest='shape_directory', help='[Optional] shapefile to clip the output computed index')
+    parser.add_argument('-t', '--threads', type=int, required=False, dest='threads', help='[Optional] number of threads used by the numpy backend')
+    parser.add_argument('--tolerance', type=int, default=1, dest='tolerance', help='maximum absolute difference accepted between the outputs (NDVI x 1000)')
+
+    args = parser.parse_args()
+    setup_logging('INFO')
+
+    band_files = search_B4_B8(args.input_dir, args.format, subfolder=True)
+
+    for red, nir, mask in zip(band_files['B4'], band_files['B8'], band_files['cloud_masks']):
+        with tempfile.TemporaryDirectory() as otb_dir, tempfile.TemporaryDirectory() as numpy_dir:
+            otb_time, otb_file = run_backend('otb', args.format, nir, red, mask, otb_dir, args.shape_directory)
+            numpy_time, numpy_file = run_backend('numpy', args.format, nir, red, mask, numpy_dir, args.shape_directory, args.threads)
+            result = compare_outputs(otb_file, numpy_file)
+
+        status = 'OK' if result['max_abs_diff'] <= args.tolerance else 'KO'
+        print(f"{os.path.basename(otb_file)}: otb {otb_time:.2f}s, numpy {numpy_time:.2f}s, "
+              f"speedup x{otb_time / numpy_time:.2f}, max diff {result['max_abs_diff']}, {result['nb_diff']} different pixels [{status}]")
@@ -0,0 +1,173 @@
+import logging
+import threading
+
+import numpy as np
+
+from osgeo import gdal
+
+from meoss_libs.numpy_backend import CREATION_OPTIONS, block_windows, map_blocks, ndvi_block, superimpose_numpy
+from meoss_libs.quantization import get_output_dtype
+
+logger = logging.getLogger('CHANGE DETECTION')
+
+
+# delta NDVI (in [-2, 2]) is written as int16, delta = value * DELTA_SCALE
+DELTA_SCALE = 0.001
+DELTA_NODATA = -32768
+
+# values of the change mask
+CHANGE_NONE = 0
+CHANGE_LOSS = 1
+CHANGE_GAIN = 2
+CHANGE_NODATA = 255
+
+
+def open_on_grid(image, reference):
+    """
+    Open an image on the grid of a reference image: directly if they share the same grid (e.g. two dates of a tile),
+    else through a virtual nearest neighbour reprojection (see superimpose_numpy).
+    """
+    data_set = gdal.Open(image, gdal.GA_ReadOnly)
+    reference_data_set = gdal.Open(reference, gdal.GA_ReadOnly)
+    if data_set is None or reference_data_set is None:
+        raise IOError(f"unable to open {image} or {reference}")
+
+    same_grid = (data_set.RasterXSize, data_set.RasterYSize) == (reference_data_set.RasterXSize, reference_data_set.RasterYSize) \
+        and np.allclose(data_set.GetGeoTransform(), reference_data_set.GetGeoTransform())
+
+    return data_set if same_grid else superimpose_numpy(image, reference)
+
+
+def ndvi_reader(source, reference, img_format=None):
+    """
+    Build a function reading the NDVI of a scene by blocks, on the grid of the reference image, as float32 with nan for
+    masked pixels. Each thread opens its own GDAL handles.
+
+    Args:
+        source: NDVI image (output of the band or concat mode, its scale, offset and nodata are applied), or
+            (nir band, red band, cloud mask) images from which the NDVI is computed on the fly, cloudy pixels masked.
+        reference: Absolute path to the image defining the grid.
+        img_format: Images formats of the band images. It can be: S2-2A-ESA, S2-2A, S2-3A.
+
+    Returns:
+        callable: function taking a (xoff, yoff, xsize, ysize) window and returning the NDVI block.
+    """
+    local = threading.local()
+
+    if isinstance(source, str):
+        def read(window):
+            if not hasattr(local, 'band'):
+                local.data_set = open_on_grid(source, reference)
+                local.band = local.data_set.GetRasterBand(1)
+                local.nodata = local.band.GetNoDataValue()
+                local.scale, local.offset = local.band.GetScale() or 1., local.band.GetOffset() or 0.
+
+            values = local.band.ReadAsArray(*window)
+            ndvi = values.astype(np.float32) * np.float32(local.scale) + np.float32(local.offset)
+            if local.nodata is not None:
+                ndvi[values == local.nodata] = np.nan
+            return ndvi
+
+        return read
+
+    nir_band_img, red_band_img, cloud_mask_img = source
+    cloud_free_mask_value = 4 if img_format == 'S2-3A' else 0
+    nodata = get_output_dtype('float32')['nodata']
+
+    def compute(window):
+        if not hasattr(local, 'data_sets'):
+            local.data_sets = (open_on_grid(nir_band_img, reference),
+                               open_on_grid(red_band_img, reference),
+                               superimpose_numpy(cloud_mask_img, reference))
+
+        nir, red, mask = (data_set.GetRasterBand(1).ReadAsArray(*window) for data_set in local.data_sets)
+        ndvi = ndvi_block(nir, red, mask, cloud_free_mask_value, 'float32')
+        ndvi[ndvi == nodata] = np.nan
+        return ndvi
+
+    return compute
+
+
+def change_block(ndvi1, ndvi2, threshold=0.2):
+    """
+    Delta NDVI between two dates and its change mask. Pixels masked (nan) at any of the two dates are nodata.
+
+    Args:
+        ndvi1: float numpy array of the NDVI of the first date, nan for masked pixels.
+        ndvi2: float numpy array of the NDVI of the second date, nan for masked pixels.
+        threshold: minimum absolute NDVI difference flagged as a change.
+
+    Returns:
+        tuple: (delta NDVI quantized to int16 (delta / DELTA_SCALE), change mask as uint8: CHANGE_LOSS where
+            delta <= -threshold, CHANGE_GAIN where delta >= threshold, CHANGE_NONE elsewhere)
+    """
+    delta = ndvi2 - ndvi1
+    valid = ~np.isnan(delta)
+
+    quantized = np.full(delta.shape, DELTA_NODATA, dtype=np.int16)
+    quantized[valid] = np.rint(delta[valid] / DELTA_SCALE)
+
+    # the threshold is applied on the quantized delta, so that the mask is consistent with the delta image
+    limit = np.rint(threshold / DELTA_SCALE)
+    change = np.full(delta.shape, CHANGE_NODATA, dtype=np.uint8)
+    change[valid] = CHANGE_NONE
+    change[valid & (quantized <= -limit)] = CHANGE_LOSS
+    change[valid & (quantized >= limit)] = CHANGE_GAIN
+
+    return quantized, change
+
+
+def ndvi_change(source1, source2, delta_file, change_file, threshold=0.2, img_format=None, block_size=512, threads=None):
+    """
+    Compute the NDVI change of a tile between two dates in a single streamed pass: both NDVI are read (or computed from
+    the bands) by strips of block_size lines and the delta NDVI and the change mask are written together. Pixels
+    masked at one of the dates (nodata, clouds) are nodata in both outputs. The second date is read on the grid of
+    the first one.
+
+    Args:
+        source1: NDVI image of the first date or (nir band, red band, cloud mask) images, see ndvi_reader.
+        source2: NDVI image of the second date or (nir band, red band, cloud mask) images, see ndvi_reader.
+        delta_file: Absolute path to the delta NDVI image (NDVI2 - NDVI1, int16, scale DELTA_SCALE).
+        change_file: Absolute path to the change mask image (uint8, see CHANGE_* values).
+        threshold: minimum absolute NDVI difference flagged as a change.
+        img_format: Images formats of the band images. It can be: S2-2A-ESA, S2-2A, S2-3A.
+        block_size: number of lines processed per block.
+        threads: number of threads, default to the number of CPU.
+
+    Returns:
+        None. The delta NDVI and change mask are written in delta_file and change_file
+    """
+    reference = source1 if isinstance(source1, str) else source1[0]
+    reference_data_set = gdal.Open(reference, gdal.GA_ReadOnly)
+    if reference_data_set is None:
+        raise IOError(f"unable to open {reference}")
+    xsize, ysize = reference_data_set.RasterXSize, reference_data_set.RasterYSize
+
+    read1 = ndvi_reader(source1, reference, img_format)
+    read2 = ndvi_reader(source2, reference, img_format)
+
+    def compute(window):
+        return change_block(read1(window), read2(window), threshold)
+
+    driver = gdal.GetDriverByName('GTiff')
+    outputs = []
+    for output_file, gdal_dtype, nodata, scale in [(delta_file, gdal.GDT_Int16, DELTA_NODATA, DELTA_SCALE),
+                                                   (change_file, gdal.GDT_Byte, CHANGE_NODATA, 1.)]:
+        data_set = driver.Create(output_file, xsize, ysize, 1, gdal_dtype, options=CREATION_OPTIONS)
+        data_set.SetGeoTransform(reference_data_set.GetGeoTransform())
+        data_set.SetProjection(reference_data_set.GetProjection())
+        band = data_set.GetRasterBand(1)
+        band.SetNoDataValue(nodata)
+        band.SetScale(scale)
+        band.SetOffset(0.)
+        outputs.append((data_set, band))
+
+    for window, blocks in map_blocks(compute, block_windows(0, 0, xsize, ysize, block_size), threads):
+        for (_, band), block in zip(outputs, blocks):
+            band.WriteArray(block, window[0], window[1])
+
+    for data_set, band in outputs:
+        band.FlushCache()
+    outputs = None
+
+    logger.debug("delta NDVI %s and change mask %s created", delta_file, change_file)
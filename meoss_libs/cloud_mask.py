@@ -0,0 +1,93 @@
+import numpy as np
+
+
+# MAJA CLM bits (S2-2A), a pixel is cloudy when any of the selected bits is set
+#   0: all clouds except the thinnest and all shadows, 1: all clouds (except the thinnest), 2: clouds detected by
+#   mono-temporal thresholds, 3: clouds detected by multi-temporal thresholds, 4: thinnest clouds, 5: cloud shadows,
+#   6: shadows of clouds outside the image, 7: high clouds
+CLM_BITS = list(range(8))
+
+# WASP FLG values (S2-3A): 0 no data, 1 cloud or shadow, 2 snow, 3 water, 4 land
+FLG_VALID_VALUES = [4]
+
+
+def decode_cloud_mask(mask, img_format, cloud_bits=None, valid_flags=None):
+    """
+    Decode a cloud mask block into invalid (cloudy) pixels, depending on the image format:
+        - S2-2A (MAJA CLM): cloudy when one of cloud_bits is set (all bits by default, i.e. CLM != 0)
+        - S2-3A (WASP FLG): cloudy when the flag is not in valid_flags (land by default, i.e. FLG != 4)
+        - S2-2A-ESA (SEN2COR CLD): cloudy when the cloud probability is not 0
+
+    Args:
+        mask: numpy array of the cloud mask.
+        img_format: Images formats. It can be: S2-2A-ESA, S2-2A, S2-3A.
+        cloud_bits: list of the CLM bits flagging cloudy pixels (S2-2A only).
+        valid_flags: list of the FLG values of valid pixels (S2-3A only).
+
+    Returns:
+        numpy.ndarray: boolean array, True for invalid pixels.
+    """
+    if img_format == 'S2-2A':
+        bit_mask = sum(1 << bit for bit in (CLM_BITS if cloud_bits is None else cloud_bits))
+        return (mask.astype(np.int64) & bit_mask) != 0
+
+    elif img_format == 'S2-3A':
+        return ~np.isin(mask, FLG_VALID_VALUES if valid_flags is None else valid_flags)
+
+    elif img_format == 'S2-2A-ESA':
+        return mask != 0
+
+    raise ValueError(f"format {img_format} not recognized, it can be: S2-2A-ESA, S2-2A, S2-3A")
+
+
+def dilate_axis(mask, radius, axis):
+    """
+    One dimensional dilation of a boolean array along an axis: a pixel is set if any pixel at a distance lower or
+    equal to radius along the axis is set. Computed with a cumulative sum, the cost does not depend on the radius.
+    """
+    if radius <= 0:
+        return mask
+
+    pad = [(0, 0)] * mask.ndim
+    pad[axis] = (radius + 1, radius)
+    cumulated = np.cumsum(np.pad(mask, pad).astype(np.int32), axis=axis)
+
+    size = mask.shape[axis]
+    upper = np.take(cumulated, np.arange(2 * radius + 1, 2 * radius + 1 + size), axis=axis)
+    lower = np.take(cumulated, np.arange(0, size), axis=axis)
+
+    return (upper - lower) > 0
+
+
+def dilate(mask, radius):
+    """
+    Dilation of a boolean array by a (2 x radius + 1) square, computed as two separable one dimensional dilations.
+
+    Args:
+        mask: 2d boolean numpy array.
+        radius: dilation radius in pixels.
+
+    Returns:
+        numpy.ndarray: dilated boolean array.
+    """
+    return dilate_axis(dilate_axis(mask, radius, axis=1), radius, axis=0)
+
+
+def halo_window(window, radius, xsize, ysize):
+    """
+    Window extended by a halo of radius pixels on each side (clamped to the image), and the position of the original
+    window in the extended one: blocks dilated with their halo give the same result as the dilation of the whole image.
+
+    Args:
+        window: (xoff, yoff, xsize, ysize) window.
+        radius: halo size in pixels.
+        xsize, ysize: size of the image.
+
+    Returns:
+        tuple: (extended window, (column, line) of the window in the extended window)
+    """
+    xoff, yoff, width, height = window
+    left, top = max(xoff - radius, 0), max(yoff - radius, 0)
+    right, bottom = min(xoff + width + radius, xsize), min(yoff + height + radius, ysize)
+
+    return (left, top, right - left, bottom - top), (xoff - left, yoff - top)
@@ -0,0 +1,206 @@
+import logging
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+import zarr
+
+from osgeo import gdal
+
+from meoss_libs.file_management import parse_output_file_name
+
+logger = logging.getLogger('DATACUBE')
+
+
+# (time, lines, columns) chunks: a pixel history over 16 dates is read from a single chunk of 256 x 256 pixels
+CHUNKS = (16, 256, 256)
+
+# arrays of the datacube (zarr group): the scenes and their acquisition time (CF convention, decoded by xarray)
+VARIABLE = 'ndvi'
+TIME = 'time'
+TIME_UNITS = 'seconds since 1970-01-01 00:00:00'
+EPOCH = datetime(1970, 1, 1)
+
+# zarr 3 writes arrays in the zarr v3 format, whose dimension names are part of the array metadata (xarray ignores the
+# _ARRAY_DIMENSIONS attribute of the zarr v2 format for them)
+ZARR_V3 = int(zarr.__version__.split('.')[0]) >= 3
+
+
+def create_array(path, dimensions, **kwargs):
+    """
+    Create a zarr array with named dimensions, in the metadata (zarr 3) or in the _ARRAY_DIMENSIONS attribute (zarr 2),
+    so the cube can be opened with xarray.open_zarr whatever the zarr version.
+
+    Args:
+        path: path of the array.
+        dimensions: names of the dimensions of the array.
+        kwargs: shape, chunks, dtype... of the array, see zarr.open_array.
+    """
+    if ZARR_V3:
+        return zarr.open_array(path, mode='w', dimension_names=tuple(dimensions), **kwargs)
+
+    array = zarr.open_array(path, mode='w', **kwargs)
+    array.attrs['_ARRAY_DIMENSIONS'] = list(dimensions)
+    return array
+
+
+def date_seconds(date):
+    """
+    Seconds between 1970-01-01 and a scene date.
+
+    Examples:
+        >>> date_seconds('20231012T105856')
+        will return 1697108336
+    """
+    return int((datetime.strptime(date, '%Y%m%dT%H%M%S') - EPOCH).total_seconds())
+
+
+def datacube_path(output_file, output_directory=None):
+    """
+    Path of the datacube (one per product and tile) in which an output file generated by generate_output_file_name
+    with the S2-2A or S2-3A format is appended.
+
+    Examples:
+        >>> datacube_path('/var/res/NDVI_T31TCJ_20231012T105856.tif')
+        will return /var/res/NDVI_T31TCJ_CUBE.zarr
+    """
+    name = parse_output_file_name(output_file)
+    if name is None:
+        raise ValueError(f"tile and date can not be read from {output_file} name")
+
+    output_directory = output_directory or os.path.dirname(output_file)
+    return os.path.join(output_directory, '_'.join(part for part in [name['prefix'], name['tile'], 'CUBE', name['suffix']] if part) + '.zarr')
+
+
+@contextmanager
+def datacube_lock(path, timeout=600, poll=0.1):
+    """
+    Exclusive lock of a datacube between processes (and hosts sharing the file system), based on the atomic creation of
+    a <path>.lock file. A lock file left by a killed process has to be removed by hand.
+
+    Args:
+        path: path of the datacube.
+        timeout: maximum waiting time of the lock in seconds.
+        poll: waiting time between two attempts in seconds.
+    """
+    lock_file = f"{path}.lock"
+    start = time.monotonic()
+
+    while True:
+        try:
+            descriptor = os.open(lock_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            if time.monotonic() - start > timeout:
+                raise TimeoutError(f"datacube {path} still locked after {timeout}s, remove {lock_file} if no process is writing it")
+            time.sleep(poll)
+
+    try:
+        os.write(descriptor, str(os.getpid()).encode())
+        yield
+    finally:
+        os.close(descriptor)
+        os.remove(lock_file)
+
+
+def append_rows(path, date, read_rows, xsize, ysize, dtype, nodata, geotransform, projection, scale=1., offset=0., chunks=CHUNKS):
+    """
+    Append a scene to a datacube, created on first append: a zarr group with a (time, lines, columns) VARIABLE array
+    and its TIME coordinate, readable with xarray.open_zarr. Scenes are appended in the order they arrive (the workers
+    of the scheduler finish them in any order), only the chunks of the new scene are written and the scenes already in
+    the cube are never rewritten. The TIME coordinate holds the acquisition time of each index: readers sort the cube by
+    date on it (e.g. xarray.open_zarr(path).sortby('time')). The scene is read and written by strips of chunk lines, it
+    is never loaded entirely in memory.
+
+    The whole append is done under datacube_lock, so several workers can append to the same cube. The date of each
+    time index is also kept in the 'dates' attribute, a date already in the cube is not appended again.
+
+    Args:
+        path: path of the datacube.
+        date: date of the scene (e.g. '20231012T105856').
+        read_rows: callable (yoff, ysize) returning the lines of the scene as a numpy array.
+        xsize, ysize: size of the scene.
+        dtype: numpy data type of the scene.
+        nodata: nodata value of the scene, fill value of the cube.
+        geotransform, projection: georeferencing of the scene, all scenes of a cube must share the same grid.
+        scale, offset: NDVI = value * scale + offset.
+        chunks: (time, lines, columns) chunk shape, used when the cube is created.
+
+    Returns:
+        int: time index of the scene in the cube, None if the date was already in the cube.
+    """
+    nodata = np.array(nodata).astype(dtype).item()
+    variable_path, time_path = os.path.join(path, VARIABLE), os.path.join(path, TIME)
+
+    with datacube_lock(path):
+        if not os.path.exists(path):
+            zarr.open_group(path, mode='w')
+            cube = create_array(variable_path, ['time', 'y', 'x'], shape=(0, ysize, xsize), chunks=chunks, dtype=dtype, fill_value=nodata)
+            cube.attrs.update({'dates': [], 'geotransform': list(geotransform), 'projection': projection,
+                               'scale_factor': scale, 'add_offset': offset})
+            times = create_array(time_path, ['time'], shape=(0,), chunks=(1024,), dtype='int64')
+            # attributes read by xarray to decode the time coordinate
+            times.attrs.update({'units': TIME_UNITS, 'calendar': 'proleptic_gregorian'})
+        else:
+            cube = zarr.open_array(variable_path, mode='r+')
+            times = zarr.open_array(time_path, mode='r+')
+
+        dates = list(cube.attrs['dates'])
+        if date in dates:
+            logger.warning(f"date {date} already in datacube {path}, it has not been appended again")
+            return None
+
+        if cube.shape[1:] != (ysize, xsize) or not np.allclose(cube.attrs['geotransform'], geotransform):
+            raise ValueError(f"scene of {date} is not on the grid of datacube {path}")
+
+        # the cube can be larger than the number of dates if a previous append was interrupted: it is overwritten
+        index = len(dates)
+        cube.resize((index + 1, ysize, xsize))
+
+        for yoff in range(0, ysize, cube.chunks[1]):
+            rows = min(cube.chunks[1], ysize - yoff)
+            cube[index, yoff:yoff + rows, :] = read_rows(yoff, rows).astype(dtype, copy=False)
+
+        # the date is only registered once its data are written
+        times.resize((index + 1,))
+        times[index] = date_seconds(date)
+        cube.attrs['dates'] = dates + [date]
+
+    logger.debug("%s appended to datacube %s at index %d", date, path, index)
+    return index
+
+
+def append_to_datacube(output_file, path=None, chunks=CHUNKS):
+    """
+    Append a NDVI image generated by the band or concat mode in the datacube of its tile.
+
+    Args:
+        output_file: Absolute path to the NDVI image, named by generate_output_file_name.
+        path: path of the datacube, default to datacube_path(output_file).
+        chunks: (time, lines, columns) chunk shape, used when the cube is created.
+
+    Returns:
+        tuple: (path of the datacube, time index of the scene or None if the date was already in the cube)
+    """
+    name = parse_output_file_name(output_file)
+    if name is None:
+        raise ValueError(f"tile and date can not be read from {output_file} name")
+    path = path or datacube_path(output_file)
+
+    data_set = gdal.Open(output_file, gdal.GA_ReadOnly)
+    if data_set is None:
+        raise IOError(f"unable to open {output_file}")
+    band = data_set.GetRasterBand(1)
+
+    def read_rows(yoff, ysize):
+        return band.ReadAsArray(0, yoff, data_set.RasterXSize, ysize)
+
+    nodata = band.GetNoDataValue()
+    dtype = read_rows(0, 1).dtype
+    index = append_rows(path, f"{name['date']}T{name['time']}", read_rows, data_set.RasterXSize, data_set.RasterYSize, dtype,
+                        0 if nodata is None else nodata, data_set.GetGeoTransform(), data_set.GetProjection(),
+                        band.GetScale() or 1., band.GetOffset() or 0., chunks)
+
+    return path, index
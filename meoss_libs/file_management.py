@@ -1,18 +1,11 @@
 import logging
 import os
+import re
 from fnmatch import fnmatch
 
-import numpy as np
-
-from osgeo import gdal
-
+# handlers and levels are configured by the entry point (see meoss_libs.log_config). Debug messages of functions
+# called for each file use lazy %-formatting: they are not formatted when debug is disabled
 logger = logging.getLogger('FILE MANAGEMENT')
-logger.setLevel(logging.DEBUG)
-ch = logging.StreamHandler()
-ch.setLevel(logging.DEBUG)
-formatter = logging.Formatter('%(asctime)s (%(levelname)s) %(name)s(l%(lineno)d): %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
-ch.setFormatter(formatter)
-logger.addHandler(ch)
 
 
 def list_files(pattern=['*'], directory=os.getcwd(), extension='tif', subfolder=False):
@@ -57,13 +50,13 @@ def list_files(pattern=['*'], directory=os.getcwd(), extension='tif', subfolder=
             if not subfolder:
                 break
 
-        logger.debug(f"{len(images)} image(s) found that match {pattern} .{extension} pattern in {directory}")
+        logger.debug("%d image(s) found that match %s .%s pattern in %s", len(images), pattern, extension, directory)
 
         images.sort()
         return images
 
     except Exception as e:
-        print(f'error while getting files: {e}')
+        logger.error(f'error while getting files: {e}')
         return []
 
 
@@ -86,7 +79,7 @@ def search_B4_B8(input_directory, img_format, subfolder=True):
 
     res = {'B4': [], 'B8': [], 'cloud_masks': [], 'format': img_format}
 
-    logger.debug(f"searching B4 and B8 bands in {input_directory} with format {img_format}")
+    logger.debug("searching B4 and B8 bands in %s with format %s", input_directory, img_format)
 
     if img_format == "S2-2A-ESA":
         logger.info("looking for S2-2A-ESA files")
@@ -111,7 +104,9 @@ def search_B4_B8(input_directory, img_format, subfolder=True):
     else:
         logger.warning("S2 format not recognized!")
 
-    logger.debug(f"B4 and B8 files found : {res}")
+    logger.info("%d B4, %d B8 and %d cloud mask file(s) found", len(res['B4']), len(res['B8']), len(res['cloud_masks']))
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"B4 and B8 files found : {res}")
 
     return res
 
@@ -171,6 +166,107 @@ def generate_output_file_name(file, format, prefix='', prefix2='', suffix=''):
     return outfile
 
 
+def parse_output_file_name(file):
+    """
+    Extract the prefix, tile and acquisition date and time from an output file name generated by
+    generate_output_file_name with the S2-2A or S2-3A format (<prefix>_<tile>_<date>T<time>_<suffix>.<extension>).
+
+    Args:
+        file (str): The output file name (with path or not).
+
+    Returns:
+        dict: 'prefix', 'tile', 'date', 'time' and 'suffix' of the file name, None if the name does not match.
+
+    Examples:
+        >>> parse_output_file_name('/var/res/NDVI_T31TCJ_20231012T105856.tif')
+        will return {'prefix': 'NDVI', 'tile': 'T31TCJ', 'date': '20231012', 'time': '105856', 'suffix': ''}
+    """
+    match = re.match(r'^(?:(?P<prefix>.+?)_)?(?P<tile>T\d{2}[A-Z]{3})_(?P<date>\d{8})T(?P<time>\d{6})(?:_(?P<suffix>.+))?$',
+                     os.path.splitext(os.path.basename(file))[0])
+
+    if match is None:
+        logger.debug("%s is not a S2-2A/S2-3A output file name", file)
+        return None
+
+    return {key: value or '' for key, value in match.groupdict().items()}
+
+
+def group_by_date(files):
+    """
+    Group the output files of several tiles by product (prefix and suffix) and acquisition date.
+    Files whose name was not generated with the S2-2A or S2-3A format are ignored.
+
+    Args:
+        files (list[str]): output files generated with generate_output_file_name.
+
+    Returns:
+        dict: {(prefix, date, suffix): [files sorted by tile]}
+
+    Examples:
+        >>> group_by_date(['NDVI_T31TDJ_20231012T105856.tif', 'NDVI_T31TCJ_20231012T105901.tif'])
+        will return {('NDVI', '20231012', ''): ['NDVI_T31TCJ_20231012T105901.tif', 'NDVI_T31TDJ_20231012T105856.tif']}
+    """
+    groups = {}
+
+    for file in files:
+        name = parse_output_file_name(file)
+        if name is None:
+            logger.debug("%s ignored, tile and date can not be read from its name", file)
+            continue
+        groups.setdefault((name['prefix'], name['date'], name['suffix']), []).append((name['tile'], file))
+
+    return {key: [file for tile, file in sorted(tiles)] for key, tiles in groups.items()}
+
+
+def generate_mosaic_file_name(prefix, date, suffix=''):
+    """
+    Generates the name of the mosaic of the products of a date, on the same pattern as generate_output_file_name.
+
+    Examples:
+        >>> generate_mosaic_file_name('NDVI', '20231012')
+        will return NDVI_MOSAIC_20231012.tif
+    """
+    return '_'.join(part for part in [prefix, 'MOSAIC', date, suffix] if part) + '.tif'
+
+
+def group_by_tile(files, names=None):
+    """
+    Group the scenes of several dates by product (prefix and suffix) and tile, sorted by acquisition date and time.
+    Scenes whose name was not generated with the S2-2A or S2-3A format are ignored.
+
+    Args:
+        files (list): output files generated with generate_output_file_name, or any scene objects if names is provided.
+        names (list[str], optional): output file names of the scenes (e.g. generate_output_file_name of their B4 band),
+            parsed instead of the files. Default to the files.
+
+    Returns:
+        dict: {(prefix, tile, suffix): [(date, files) sorted by date and time]}
+
+    Examples:
+        >>> group_by_tile(['NDVI_T31TCJ_20231017T105859.tif', 'NDVI_T31TCJ_20231012T105901.tif'])
+        will return {('NDVI', 'T31TCJ', ''): [('20231012', 'NDVI_T31TCJ_20231012T105901.tif'), ('20231017', 'NDVI_T31TCJ_20231017T105859.tif')]}
+    """
+    groups = {}
+
+    for file, name in zip(files, files if names is None else names):
+        parsed = parse_output_file_name(name)
+        if parsed is None:
+            logger.debug("%s ignored, tile and date can not be read from its name", name)
+            continue
+        groups.setdefault((parsed['prefix'], parsed['tile'], parsed['suffix']), []).append((parsed['date'] + parsed['time'], parsed['date'], file))
+
+    return {key: [(date, file) for _, date, file in sorted(scenes, key=lambda scene: scene[0])] for key, scenes in groups.items()}
+
+
+def generate_change_file_name(prefix, tile, date1, date2, suffix=''):
+    """
+    Generates the name of a product comparing two dates of a tile, on the same pattern as generate_output_file_name.
+
+    Examples:
+        >>> generate_change_file_name('DELTA_NDVI', 'T31TCJ', '20231012', '20231017')
+        will return DELTA_NDVI_T31TCJ_20231012_20231017.tif
+    """
+    return '_'.join(part for part in [prefix, tile, date1, date2, suffix] if part) + '.tif'
 
 
 ####################################################################
@@ -178,6 +274,8 @@ def generate_output_file_name(file, format, prefix='', prefix2='', suffix=''):
 ####   CODE NOT MODIFIED AS NOT IN SCOPE OF THE TEST      ##########
 ####   CODE NOT USED FOR THE NEW NDVI CALCULATION SCRIPT  ##########
 ####################################################################
+# numpy and gdal are only imported by the legacy functions using them,
+# so that the file search functions can be used without loading them
 def open_image(filename, verbose=False):
     """
     Open an image file with gdal
@@ -191,6 +289,8 @@ def open_image(filename, verbose=False):
     ------
     osgeo.gdal.Dataset
     """
+    from osgeo import gdal
+
     data_set = gdal.Open(filename, gdal.GA_ReadOnly)
 
     if data_set is None:
@@ -238,6 +338,9 @@ def write_image(out_filename, array, data_set=None, gdal_dtype=None, transform=N
     -------
     None
     """
+    import numpy as np
+    from osgeo import gdal
+
     # Get information from array if the parameter is missing
     nb_col = nb_col if nb_col is not None else array.shape[1]
     nb_ligne = nb_ligne if nb_ligne is not None else array.shape[0]
@@ -306,6 +409,9 @@ def write_data_set(array, data_set=None, gdal_dtype=None, transform=None, projec
     -------
     output_data_set : GDAL data set
     """
+    import numpy as np
+    from osgeo import gdal
+
     # Get information from array if the parameter is missing
     nb_col = nb_col if nb_col is not None else array.shape[1]
     nb_ligne = nb_ligne if nb_ligne is not None else array.shape[0]
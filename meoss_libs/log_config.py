@@ -0,0 +1,153 @@
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import multiprocessing
+from contextlib import contextmanager
+
+TEXT_FORMAT = '%(asctime)s (%(levelname)s) %(name)s(l%(lineno)d): %(message)s'
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# context fields (scene, tile, date...) added to the records emitted in the current thread, see log_context
+_context = contextvars.ContextVar('log_context', default={})
+
+# handlers and queue listener installed by setup_logging, replaced when it is called again
+_installed = {'handlers': [], 'listener': None}
+
+
+@contextmanager
+def log_context(**fields):
+    """
+    Add context fields to all the records logged inside the block (nested blocks add their own fields).
+
+    Examples:
+        >>> with log_context(scene='SENTINEL2B_20231012-105856-000_L2A_T31TCJ_C_V3-1', tile='T31TCJ'):
+        >>>     logger.info("NDVI File created")
+    """
+    token = _context.set({**_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    """
+    Store the current context fields in record.context. Records coming from another process through a queue already
+    have their context, which is kept.
+    """
+
+    def filter(self, record):
+        if not hasattr(record, 'context'):
+            record.context = _context.get()
+        return True
+
+
+class TextFormatter(logging.Formatter):
+    """
+    Human readable format of the repository, context fields are appended as [key=value ...].
+    """
+
+    def __init__(self):
+        super().__init__(TEXT_FORMAT, datefmt=DATE_FORMAT)
+
+    def format(self, record):
+        message = super().format(record)
+        context = getattr(record, 'context', None)
+        if context:
+            message += ' [' + ' '.join(f"{key}={value}" for key, value in context.items()) + ']'
+        return message
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line, context fields are added as top level keys.
+    """
+
+    def format(self, record):
+        entry = {'time': self.formatTime(record, DATE_FORMAT), 'level': record.levelname, 'logger': record.name,
+                 'line': record.lineno, 'process': record.process, 'message': record.getMessage()}
+        entry.update(getattr(record, 'context', None) or {})
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def setup_logging(level='INFO', log_format='text', log_file=None, use_queue=False):
+    """
+    Configure the logging of all the loggers of the repository (root logger). Modules only create their logger,
+    handlers and levels are set here, once, by the entry point.
+
+    Args:
+        level: logging level name or value.
+        log_format: 'text' (human readable) or 'json' (one JSON object per line).
+        log_file: path of the log file, logs are written on stderr if None.
+        use_queue: if True, records are put in a multiprocessing queue and written by a listener thread: emitting a
+            record is cheap and worker processes (see setup_worker_logging) share the same output.
+
+    Returns:
+        multiprocessing.Queue: queue to give to setup_worker_logging in worker processes, None without queue.
+    """
+    if log_format not in ['text', 'json']:
+        raise ValueError(f"log format {log_format} not recognized, it can be: text, json")
+
+    shutdown_logging()
+
+    handler = logging.FileHandler(log_file) if log_file else logging.StreamHandler()
+    handler.setFormatter(JsonFormatter() if log_format == 'json' else TextFormatter())
+
+    root = logging.getLogger()
+    root.setLevel(level)
+
+    if use_queue:
+        queue = multiprocessing.Queue()
+        front = logging.handlers.QueueHandler(queue)
+        _installed['listener'] = logging.handlers.QueueListener(queue, handler)
+        _installed['listener'].start()
+    else:
+        queue = None
+        front = handler
+
+    front.addFilter(ContextFilter())
+    root.addHandler(front)
+    _installed['handlers'] = [front]
+
+    # registered after the creation of the queue, so the listener is stopped (pending records written) before
+    # multiprocessing closes its queues at exit
+    atexit.unregister(shutdown_logging)
+    atexit.register(shutdown_logging)
+
+    return queue
+
+
+def setup_worker_logging(queue, level='INFO'):
+    """
+    Configure the logging of a worker process: records are sent to the queue returned by setup_logging in the main
+    process. To be used as initializer of the process pools.
+    """
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+
+    front = logging.handlers.QueueHandler(queue)
+    front.addFilter(ContextFilter())
+    root.addHandler(front)
+    root.setLevel(level)
+
+
+def shutdown_logging():
+    """
+    Stop the queue listener (pending records are written) and remove the handlers installed by setup_logging.
+    """
+    root = logging.getLogger()
+    for handler in _installed['handlers']:
+        root.removeHandler(handler)
+        handler.close()
+    _installed['handlers'] = []
+
+    if _installed['listener'] is not None:
+        _installed['listener'].stop()
+        for handler in _installed['listener'].handlers:
+            handler.close()
+        _installed['listener'] = None
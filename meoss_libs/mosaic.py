@@ -0,0 +1,129 @@
+import logging
+import threading
+
+import numpy as np
+
+from osgeo import gdal, ogr
+
+from meoss_libs.numpy_backend import CREATION_OPTIONS, block_windows, map_blocks
+
+logger = logging.getLogger('MOSAIC')
+
+
+def shape_file_bounds(shape_file):
+    """
+    Extent of the first layer of a shape file as [xmin, ymin, xmax, ymax].
+    """
+    vector = ogr.Open(shape_file)
+    if vector is None:
+        raise IOError(f"unable to open shape file {shape_file}")
+
+    xmin, xmax, ymin, ymax = vector.GetLayer(0).GetExtent()
+    return [xmin, ymin, xmax, ymax]
+
+
+def build_mosaic_vrt(files, nodata=0, shape_file=None):
+    """
+    Build the virtual index of a mosaic: each file is a band of a VRT covering the union of the files (or the AOI
+    extent if a shape file is provided). Nothing is read, the tiles are only aligned on a common grid.
+    The files must have the same CRS and resolution.
+
+    Args:
+        files: list of the images to mosaic.
+        nodata: value of the invalid pixels in the images.
+        shape_file: Absolute path to a shape file (same CRS as the images) whose extent is used to clip the mosaic.
+
+    Returns:
+        str: VRT XML description, which can be opened by gdal.Open.
+    """
+    options = {'separate': True, 'srcNodata': nodata, 'VRTNodata': nodata, 'resolution': 'highest'}
+    if shape_file:
+        options['outputBounds'] = shape_file_bounds(shape_file)
+
+    vrt = gdal.BuildVRT('', files, options=gdal.BuildVRTOptions(**options))
+    if vrt is None or vrt.RasterCount != len(files):
+        raise ValueError(f"unable to build a mosaic of {files}, images must have the same CRS")
+
+    return vrt.GetMetadata('xml:VRT')[0]
+
+
+def resolve_overlap(stack, nodata=0, overlap='max'):
+    """
+    Merge a stack of aligned blocks in a single block.
+
+    Args:
+        stack: numpy array (nb images, lines, columns).
+        nodata: value of the invalid pixels.
+        overlap: 'max' to keep the maximum valid value (maximum NDVI), 'first' to keep the first valid value in the
+            stack order.
+
+    Returns:
+        numpy.ndarray: (lines, columns) block, nodata where no image is valid.
+    """
+    valid = stack != nodata
+
+    if overlap == 'max':
+        merged = np.ma.masked_array(stack, mask=~valid).max(axis=0)
+        return np.ma.filled(merged, nodata).astype(stack.dtype)
+
+    elif overlap == 'first':
+        first = np.take_along_axis(stack, valid.argmax(axis=0)[np.newaxis], axis=0)[0]
+        first[~valid.any(axis=0)] = nodata
+        return first
+
+    raise ValueError(f"overlap {overlap} not recognized, it can be: max, first")
+
+
+def mosaic_ndvi(files, output_file, overlap='max', nodata=None, shape_file=None, block_size=512, threads=None):
+    """
+    Mosaic images of the same date (e.g. NDVI of adjacent tiles) in a single image, clipped to the AOI extent if a
+    shape file is provided. The mosaic is streamed by strips of block_size lines read through a VRT index, whole tiles
+    are never loaded in memory.
+
+    Args:
+        files: list of the images to mosaic, same CRS and resolution.
+        output_file: Absolute path to the output image.
+        overlap: 'max' (maximum NDVI) or 'first' (first valid value, in files order) where images overlap.
+        nodata: value of the invalid pixels in the images, written as nodata in the output. Default to the nodata of
+            the first image (written with its --out-dtype), or 0 (band mode masked pixels) if it has none.
+        shape_file: Absolute path to the shape file used to clip the mosaic, optional.
+        block_size: number of lines processed per block.
+        threads: number of threads, default to the number of CPU.
+
+    Returns:
+        None. The mosaic is written in output_file
+    """
+    # scale, offset and nodata of the products (see meoss_libs.quantization) are kept in the mosaic
+    first_band = gdal.Open(files[0]).GetRasterBand(1)
+    if nodata is None:
+        nodata = first_band.GetNoDataValue()
+        nodata = 0 if nodata is None else nodata
+
+    vrt_xml = build_mosaic_vrt(files, nodata, shape_file)
+    vrt = gdal.Open(vrt_xml)
+    xsize, ysize = vrt.RasterXSize, vrt.RasterYSize
+
+    local = threading.local()
+
+    def merge(window):
+        if not hasattr(local, 'vrt'):
+            local.vrt = gdal.Open(vrt_xml)
+        stack = local.vrt.ReadAsArray(*window).reshape(len(files), window[3], window[2])
+        return resolve_overlap(stack, nodata, overlap)
+
+    driver = gdal.GetDriverByName('GTiff')
+    output_data_set = driver.Create(output_file, xsize, ysize, 1, vrt.GetRasterBand(1).DataType, options=CREATION_OPTIONS)
+    output_data_set.SetGeoTransform(vrt.GetGeoTransform())
+    output_data_set.SetProjection(vrt.GetProjection())
+    output_band = output_data_set.GetRasterBand(1)
+    output_band.SetNoDataValue(nodata)
+    output_band.SetScale(first_band.GetScale() or 1)
+    output_band.SetOffset(first_band.GetOffset() or 0)
+
+    for window, block in map_blocks(merge, block_windows(0, 0, xsize, ysize, block_size), threads):
+        output_band.WriteArray(block, window[0], window[1])
+
+    output_band.FlushCache()
+    del output_band
+    output_data_set = None
+    logger.debug("%d image(s) mosaicked in %s", len(files), output_file)
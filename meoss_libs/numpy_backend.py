@@ -0,0 +1,275 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from osgeo import gdal, ogr
+
+from meoss_libs.cloud_mask import dilate, halo_window
+from meoss_libs.preview import PREVIEW_FACTOR, PreviewAccumulator, write_preview
+from meoss_libs.quantization import get_output_dtype, quantization_coefficients, apply_quantization_metadata, INPUT_NODATA
+
+# numexpr is optional: when available, band math is evaluated in a single multi-threaded pass without temporaries
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
+
+logger = logging.getLogger('NUMPY BACKEND')
+
+
+# creation options equivalent to the "?gdal:co:COMPRESS=DEFLATE&gdal:co:BIGTIFF=YES" extended filename used with OTB
+CREATION_OPTIONS = ['COMPRESS=DEFLATE', 'BIGTIFF=YES']
+
+
+def superimpose_numpy(cloud_mask_img, nir_band_img, interpolator='nn'):
+    """
+    Numpy backend equivalent of superimpose_otb: project the cloud mask on the grid of the reference image.
+    The result is a virtual (VRT) dataset, pixels are only resampled when blocks are read.
+
+    Args:
+        cloud_mask_img: Absolute path to the image to reproject.
+        nir_band_img: Absolute path to the reference image.
+        interpolator: only 'nn' (nearest neighbour) is supported, as for masks any other interpolation is meaningless.
+
+    Returns:
+        gdal.Dataset: virtual dataset of the mask aligned on the reference image.
+    """
+    if interpolator != 'nn':
+        raise ValueError(f"interpolator {interpolator} not supported by the numpy backend, only 'nn' is available")
+
+    reference = gdal.Open(nir_band_img, gdal.GA_ReadOnly)
+    transform = reference.GetGeoTransform()
+    bounds = [transform[0],
+              transform[3] + transform[5] * reference.RasterYSize,
+              transform[0] + transform[1] * reference.RasterXSize,
+              transform[3]]
+
+    return gdal.Warp('', cloud_mask_img, format='VRT', outputBounds=bounds, width=reference.RasterXSize,
+                     height=reference.RasterYSize, dstSRS=reference.GetProjection(), resampleAlg='near')
+
+
+def extract_ROI_window(data_set, shape_file):
+    """
+    Numpy backend equivalent of the 'fit' mode of extract_ROI_otb: compute the pixel window of the image which covers
+    the extent of the shape file. The shape file must have the same CRS as the image.
+
+    Args:
+        data_set: gdal.Dataset of the image to clip.
+        shape_file: Absolute path to the shape file.
+
+    Returns:
+        tuple: (xoff, yoff, xsize, ysize) window in pixels, clamped to the image size.
+    """
+    vector = ogr.Open(shape_file)
+    if vector is None:
+        raise IOError(f"unable to open shape file {shape_file}")
+
+    xmin, xmax, ymin, ymax = vector.GetLayer(0).GetExtent()
+    transform = data_set.GetGeoTransform()
+
+    col_min = int(np.floor((xmin - transform[0]) / transform[1]))
+    col_max = int(np.ceil((xmax - transform[0]) / transform[1]))
+    row_min = int(np.floor((ymax - transform[3]) / transform[5]))
+    row_max = int(np.ceil((ymin - transform[3]) / transform[5]))
+
+    col_min, col_max = max(col_min, 0), min(col_max, data_set.RasterXSize)
+    row_min, row_max = max(row_min, 0), min(row_max, data_set.RasterYSize)
+
+    if col_max <= col_min or row_max <= row_min:
+        raise ValueError(f"shape file {shape_file} does not intersect the image")
+
+    return col_min, row_min, col_max - col_min, row_max - row_min
+
+
+def ndvi_block(nir, red, mask, cloud_free_mask_value, out_dtype='int16', input_nodata=INPUT_NODATA):
+    """
+    Compute the masked and quantized NDVI of a block, same expressions as the OTB band mode:
+    (im1b1-im2b1)/(im1b1+im2b1+1.E-6) quantized to out_dtype, then (mask=={cloud_free_mask_value})?ndvi:nodata.
+    The quantization is fused in the NDVI expression, there is no separate rescaling pass.
+    Pixels where the red or the near infrared reflectance is input nodata are also set to nodata.
+
+    Args:
+        nir: numpy array of the near infrared band.
+        red: numpy array of the red band.
+        mask: numpy array of the cloud mask (on the same grid).
+        cloud_free_mask_value: value of the cloud free pixels in the mask.
+        out_dtype: output data type (see meoss_libs.quantization). Default to int16 (NDVI x 1000).
+        input_nodata: reflectances lower or equal to this value are not valid (MAJA products: -10000).
+
+    Returns:
+        numpy.ndarray: NDVI block of out_dtype type.
+    """
+    spec = get_output_dtype(out_dtype)
+    gain, bias = quantization_coefficients(out_dtype)
+
+    # OTB BandMath computes in double and writes float, the integer cast of the OTB output truncates towards zero:
+    # both the numexpr and numpy paths compute in double so the output does not depend on numexpr
+    nir = nir.astype(np.float64, copy=False)
+    red = red.astype(np.float64, copy=False)
+
+    if numexpr is not None:
+        ndvi = numexpr.evaluate("(nir - red) / (nir + red + 1.E-6) * gain + bias")
+    else:
+        ndvi = (nir - red) / (nir + red + 1.E-6) * gain + bias
+
+    ndvi = ndvi.astype(np.float32)
+    if spec['min'] is not None:
+        ndvi = np.clip(np.trunc(ndvi), spec['min'], spec['max'])
+
+    valid = (mask == cloud_free_mask_value) & (nir > input_nodata) & (red > input_nodata)
+
+    return np.where(valid, ndvi, spec['nodata']).astype(spec['numpy'])
+
+
+def temporary_output_file(output_file):
+    """
+    Temporary name of an output while it is written, in the same directory (so it is renamed atomically) and with an
+    extension which is not listed as a product.
+
+    Examples:
+        >>> temporary_output_file('/var/res/NDVI_T31TCJ_20231012T105856.tif')
+        will return /var/res/.NDVI_T31TCJ_20231012T105856.tif.<pid>.tmp
+    """
+    return os.path.join(os.path.dirname(output_file), f".{os.path.basename(output_file)}.{os.getpid()}.tmp")
+
+
+def block_windows(xoff, yoff, xsize, ysize, block_size):
+    """
+    Split a window in strips of block_size lines covering its full width.
+
+    Returns:
+        list: list of (xoff, yoff, xsize, ysize) windows.
+    """
+    return [(xoff, row, xsize, min(block_size, yoff + ysize - row)) for row in range(yoff, yoff + ysize, block_size)]
+
+
+def map_blocks(function, windows, threads=None):
+    """
+    Apply function on each window with a pool of threads and yield results in the windows order.
+    The number of blocks in flight is bounded so memory stays proportional to the number of threads, not to the image.
+
+    Args:
+        function: callable taking a window and returning a numpy array.
+        windows: list of windows as returned by block_windows.
+        threads: number of threads, default to the number of CPU.
+
+    Yields:
+        tuple: (window, result)
+    """
+    threads = threads or os.cpu_count() or 1
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        pending = []
+        for window in windows:
+            pending.append((window, executor.submit(function, window)))
+            if len(pending) >= 2 * threads:
+                window, future = pending.pop(0)
+                yield window, future.result()
+
+        for window, future in pending:
+            yield window, future.result()
+
+
+def ndvi_band_numpy(nir_band_img, red_band_img, cloud_mask_img, output_file, cloud_free_mask_value=0, shape_file=None,
+                    block_size=512, threads=None, out_dtype='int16', preview=None, preview_factor=PREVIEW_FACTOR,
+                    mask_decoder=None, mask_dilation=0):
+    """
+    Numpy backend of the band mode: superimpose the cloud mask, compute the NDVI, apply the cloud mask,
+    quantize to out_dtype and clip with the shape file extent if provided. Same semantics as the OTB chain
+    superimpose_otb -> bandmath_otb x2 -> managenodata_otb -> extract_ROI_otb.
+
+    The image is processed by strips of block_size lines, read and computed in parallel threads (each thread has its
+    own GDAL handles, GDAL datasets are not thread safe), and written sequentially in the output file.
+    If a preview is requested, it is built from the blocks while they are written.
+
+    The cloud mask can be decoded by mask_decoder (e.g. MAJA CLM bits, see meoss_libs.cloud_mask) and its cloudy pixels
+    dilated by mask_dilation pixels. The mask of each block is then read with a halo of mask_dilation pixels, so the
+    dilation streams with the blocks and gives the same result as a dilation of the whole mask.
+
+    Args:
+        nir_band_img: Absolute path to the near infrared band image.
+        red_band_img: Absolute path to the red band image.
+        cloud_mask_img: Absolute path to the cloud mask image.
+        output_file: Absolute path to the output image.
+        cloud_free_mask_value: value of the cloud free pixels in the mask.
+        shape_file: Absolute path to the shape file used to clip the output, optional.
+        block_size: number of lines processed per block.
+        threads: number of threads, default to the number of CPU.
+        out_dtype: output data type (see meoss_libs.quantization), scale, offset and nodata are written in the metadata.
+        preview: quick-look format ('png' or 'jpeg') of the preview written next to the output, no preview if None.
+        preview_factor: reduction factor of the preview (6: 10 m -> 60 m).
+        mask_decoder: callable returning the cloudy pixels (boolean array) of a mask block, default to
+            mask != cloud_free_mask_value.
+        mask_dilation: dilation radius of the cloudy pixels, in pixels (0: no dilation).
+
+    Returns:
+        None. The NDVI image is written in output_file
+    """
+    reference = gdal.Open(nir_band_img, gdal.GA_ReadOnly)
+    if reference is None:
+        raise IOError(f"unable to open {nir_band_img}")
+
+    if shape_file:
+        xoff, yoff, xsize, ysize = extract_ROI_window(reference, shape_file)
+    else:
+        xoff, yoff, xsize, ysize = 0, 0, reference.RasterXSize, reference.RasterYSize
+
+    local = threading.local()
+
+    def compute(window):
+        if not hasattr(local, 'datasets'):
+            local.datasets = (gdal.Open(nir_band_img, gdal.GA_ReadOnly),
+                              gdal.Open(red_band_img, gdal.GA_ReadOnly),
+                              superimpose_numpy(cloud_mask_img, nir_band_img))
+        nir, red, mask_data_set = local.datasets
+        nir, red = (data_set.GetRasterBand(1).ReadAsArray(*window) for data_set in (nir, red))
+
+        if mask_decoder is None and not mask_dilation:
+            return ndvi_block(nir, red, mask_data_set.GetRasterBand(1).ReadAsArray(*window), cloud_free_mask_value, out_dtype)
+
+        halo, (col, row) = halo_window(window, mask_dilation, mask_data_set.RasterXSize, mask_data_set.RasterYSize)
+        mask = mask_data_set.GetRasterBand(1).ReadAsArray(*halo)
+        cloudy = mask_decoder(mask) if mask_decoder is not None else mask != cloud_free_mask_value
+        cloudy = dilate(cloudy, mask_dilation)[row:row + window[3], col:col + window[2]]
+        return ndvi_block(nir, red, ~cloudy, True, out_dtype)
+
+    transform = list(reference.GetGeoTransform())
+    transform[0] += xoff * transform[1]
+    transform[3] += yoff * transform[5]
+
+    spec = get_output_dtype(out_dtype)
+    accumulator = PreviewAccumulator(xsize, ysize, preview_factor, spec['nodata']) if preview else None
+
+    # the image is written under a temporary name and renamed once complete: a run interrupted mid-write does not leave
+    # a partial output that the next run would skip as already existing
+    temporary_file = temporary_output_file(output_file)
+    try:
+        driver = gdal.GetDriverByName('GTiff')
+        output_data_set = driver.Create(temporary_file, xsize, ysize, 1, gdal.GetDataTypeByName(spec['gdal']), options=CREATION_OPTIONS)
+        output_data_set.SetGeoTransform(transform)
+        output_data_set.SetProjection(reference.GetProjection())
+        output_band = output_data_set.GetRasterBand(1)
+        apply_quantization_metadata(output_band, out_dtype)
+
+        for window, block in map_blocks(compute, block_windows(xoff, yoff, xsize, ysize, block_size), threads):
+            output_band.WriteArray(block, window[0] - xoff, window[1] - yoff)
+            if accumulator is not None:
+                accumulator.add(block, window[0] - xoff, window[1] - yoff)
+
+        output_band.FlushCache()
+        del output_band
+        output_data_set = None
+        os.replace(temporary_file, output_file)
+
+    except BaseException:
+        output_data_set = None
+        if os.path.exists(temporary_file):
+            os.remove(temporary_file)
+        raise
+
+    if accumulator is not None:
+        write_preview(output_file, accumulator.result(), transform, reference.GetProjection(), preview_factor,
+                      spec['scale'], spec['offset'], spec['nodata'], preview)
@@ -1,4 +1,5 @@
-import otbApplication
+# otbApplication is imported in each function and not at module level:
+# loading OTB takes seconds, it is only paid when an application is actually created
 
 
 # TODO: MAYBE BETTER TO USE CLASS INSTEAD OF FUNCTION. NEED MORE USE CASES TO DECIDE.
@@ -8,7 +9,90 @@ import otbApplication
 # TODO add logger and Exception error management
 
 
-def superimpose_otb(cloud_mask_img, nir_band_img, output_file, interpolator='nn', out_pixel_type=otbApplication.ImagePixelType_int16 , ram=4000):
+class OtbApplicationPool:
+    """
+    Keep the otb applications created by a worker to reuse them from one scene to the next.
+
+    Creating an application (Registry.CreateApplication) and building its graph costs more than the processing of a
+    small AOI clip. With a pool, each worker creates its applications once, and for each new scene they are reset
+    (parameters cleared, pipeline resources freed) before new inputs and outputs are bound.
+
+    The same application name can be used several times in a graph (e.g. two BandMath), applications are therefore
+    identified by a key and their name: one application per (key, name), so graphs of different modes can use the same
+    key for different applications.
+
+    Examples:
+        >>> pool = OtbApplicationPool()
+        >>> for image, ndvi in scenes:
+        >>>     radiometric_indices_otb(image, ndvi, 4, 3, app=pool.get('ndvi', 'RadiometricIndices'))
+    """
+
+    def __init__(self):
+        self.applications = {}
+
+    def get(self, key, name):
+        """
+        Return the application of the key, reset to be bound to a new scene. The application is created on first use.
+
+        Args:
+            key: identifier of the application in the processing graph.
+            name: otb application name (e.g. 'BandMath').
+
+        Returns:
+            app: otbApplication object
+        """
+        app = self.applications.get((key, name))
+
+        if app is None:
+            import otbApplication
+
+            app = otbApplication.Registry.CreateApplication(name)
+            self.applications[(key, name)] = app
+        else:
+            reset_application(app)
+
+        return app
+
+    def clear(self):
+        """
+        Release all the applications of the pool.
+        """
+        for app in self.applications.values():
+            reset_application(app)
+        self.applications = {}
+
+
+def reset_application(app):
+    """
+    Reset an otb application so it can be executed again with other parameters: the internal pipeline is released and
+    every parameter set by the user is cleared (input image lists would otherwise be appended to the previous ones).
+
+    Args:
+        app: otbApplication object
+    """
+    app.FreeRessources()
+
+    for key in app.GetParametersKeys():
+        if app.HasUserValue(key):
+            app.ClearValue(key)
+
+
+def otb_pixel_type(out_pixel_type):
+    """
+    Convert a pixel type name (e.g. 'int16', 'uint8', 'float') to its otbApplication.ImagePixelType_* constant.
+    Constants are returned unchanged and None gives otbApplication.ImagePixelType_int16.
+    """
+    import otbApplication
+
+    if out_pixel_type is None:
+        return otbApplication.ImagePixelType_int16
+    if isinstance(out_pixel_type, str):
+        return getattr(otbApplication, f"ImagePixelType_{out_pixel_type}")
+
+    return out_pixel_type
+
+
+def superimpose_otb(cloud_mask_img, nir_band_img, output_file, interpolator='nn', out_pixel_type=None , ram=4000, app=None):
     """
     wrap the otb Superimpose application to be  used in python as a single function
 
@@ -17,14 +101,21 @@ def superimpose_otb(cloud_mask_img, nir_band_img, output_file, interpolator='nn'
         nir_band_img:
         interpolator:
         output_file:
-        out_pixel_type:
+        out_pixel_type: otbApplication pixel type or its name (e.g. 'uint8'), default to otbApplication.ImagePixelType_int16 (when None)
         ram:
+        app: otbApplication object to reuse (e.g. from an OtbApplicationPool), a new one is created if None.
 
     Returns:
         app: otbApplication object
 
     """
-    app = otbApplication.Registry.CreateApplication("Superimpose")
+    import otbApplication
+
+    out_pixel_type = otb_pixel_type(out_pixel_type)
+
+    if app is None:
+        app = otbApplication.Registry.CreateApplication("Superimpose")
+
     app.SetParameterString("inm", cloud_mask_img)  # image to reproject
     app.SetParameterString("inr", nir_band_img)  # image to reference
     app.SetParameterString("out", output_file)
@@ -36,7 +127,7 @@ def superimpose_otb(cloud_mask_img, nir_band_img, output_file, interpolator='nn'
     return app
 
 
-def bandmath_otb(il=[], il_object=[] , output_file='temp1.tif', exp='', ram=4000):
+def bandmath_otb(il=[], il_object=[] , output_file='temp1.tif', exp='', ram=4000, app=None):
     """
     wrap the otb BandMath application to be  used in python as a single function
 
@@ -46,12 +137,16 @@ def bandmath_otb(il=[], il_object=[] , output_file='temp1.tif', exp='', ram=4000
         output_file:
         exp:
         ram:
+        app: otbApplication object to reuse (e.g. from an OtbApplicationPool), a new one is created if None.
 
     Returns:
         app: otbApplication object
 
     """
-    app = otbApplication.Registry.CreateApplication("BandMath")
+    import otbApplication
+
+    if app is None:
+        app = otbApplication.Registry.CreateApplication("BandMath")
 
     for img in il:
         app.AddParameterStringList("il", img)
@@ -66,7 +161,7 @@ def bandmath_otb(il=[], il_object=[] , output_file='temp1.tif', exp='', ram=4000
     return app
 
 
-def managenodata_otb(input_image,action, output_image, out_pixel_type=otbApplication.ImagePixelType_int16,  mode='changevalue'):
+def managenodata_otb(input_image,action, output_image, out_pixel_type=None,  mode='changevalue', app=None):
     """
     wrap the otb ManageNoData application to be  used in python as a single function
 
@@ -74,15 +169,21 @@ def managenodata_otb(input_image,action, output_image, out_pixel_type=otbApplica
         input_image:
         action: action to be performed by the application. can be 'exe' or 'write&exe'.
         output_image:
-        out_pixel_type: default to otbApplication.ImagePixelType_int16
+        out_pixel_type: otbApplication pixel type or its name (e.g. 'uint8'), default to otbApplication.ImagePixelType_int16 (when None)
         mode:  default to 'changevalue'
+        app: otbApplication object to reuse (e.g. from an OtbApplicationPool), a new one is created if None.
 
     Returns:
         app: otbApplication object
 
     """
+    import otbApplication
+
+    out_pixel_type = otb_pixel_type(out_pixel_type)
+
+    if app is None:
+        app = otbApplication.Registry.CreateApplication("ManageNoData")
 
-    app = otbApplication.Registry.CreateApplication("ManageNoData")
     app.SetParameterInputImage("in", input_image)
     app.SetParameterString("out", output_image)
     app.SetParameterOutputImagePixelType("out", out_pixel_type)
@@ -96,7 +197,7 @@ def managenodata_otb(input_image,action, output_image, out_pixel_type=otbApplica
     return app
 
 
-def extract_ROI_otb(input_file, shape_file, output_file, out_pixel_type=otbApplication.ImagePixelType_int16, mode='fit', ram=1000):
+def extract_ROI_otb(input_file, shape_file, output_file, out_pixel_type=None, mode='fit', ram=1000, app=None):
     """
     wrap the otb ExtractROI application to be  used in python as a single function
 
@@ -104,15 +205,22 @@ def extract_ROI_otb(input_file, shape_file, output_file, out_pixel_type=otbAppli
         input_file:
         shape_file:
         output_file:
-        out_pixel_type:
+        out_pixel_type: otbApplication pixel type or its name (e.g. 'uint8'), default to otbApplication.ImagePixelType_int16 (when None)
         mode:
         ram:
+        app: otbApplication object to reuse (e.g. from an OtbApplicationPool), a new one is created if None.
 
     Returns:
         app: otbApplication object
 
     """
-    app = otbApplication.Registry.CreateApplication("ExtractROI")
+    import otbApplication
+
+    out_pixel_type = otb_pixel_type(out_pixel_type)
+
+    if app is None:
+        app = otbApplication.Registry.CreateApplication("ExtractROI")
+
     app.SetParameterInputImage("in", input_file)
     app.SetParameterString("mode", mode)
     app.SetParameterString("mode.fit.vect", shape_file)
@@ -124,29 +232,74 @@ def extract_ROI_otb(input_file, shape_file, output_file, out_pixel_type=otbAppli
     return app
 
 
-def radiometric_indices_otb(input_file, output_file , nir_band_nb=1, red_band_nb=1, radiometric_indices=['Vegetation:NDVI']):
+def concatenate_images_otb(il=[], il_object=[], output_file='temp0.tif', ram=4000, app=None):
+    """
+    wrap the otb ConcatenateImages application to be  used in python as a single function.
+    The application is only executed (not written): its output is a virtual stack of the input images, read by
+    the next application of the pipeline without writing a concatenated copy of the bands.
+
+    Args:
+        il: Absolute paths to the images to stack, one band per image, in the output band order.
+        il_object: images (output of other applications) to stack, after the il images.
+        output_file:
+        ram:
+        app: otbApplication object to reuse (e.g. from an OtbApplicationPool), a new one is created if None.
+
+    Returns:
+        app: otbApplication object
+
+    """
+    import otbApplication
+
+    if app is None:
+        app = otbApplication.Registry.CreateApplication("ConcatenateImages")
+
+    for img in il:
+        app.AddParameterStringList("il", img)
+    for img in il_object:
+        app.AddImageToParameterInputImageList("il", img)
+
+    app.SetParameterString("out", output_file)
+    app.SetParameterInt("ram", ram)
+    app.Execute()
+
+    return app
+
+
+def radiometric_indices_otb(input_file, output_file , nir_band_nb=1, red_band_nb=1, radiometric_indices=['Vegetation:NDVI'], action='write&exe', app=None):
     """
     wrap the otb RadiometricIndices application to be  used in python as a single function
 
     Args:
-        input_file: Absolute path to the input image.
+        input_file: Absolute path to the input image, or image object (output of another application, e.g. concatenate_images_otb).
         output_file: Asbolute path to the output image.
         nir_band_nb:  NIR channel index.
         red_band_nb: RED channel index.
         radiometric_indices: radiometric indices (check otb documentation for all available indices)
+        action: action to be performed by the application. can be 'exe' or 'write&exe'. default to 'write&exe'
+        app: otbApplication object to reuse (e.g. from an OtbApplicationPool), a new one is created if None.
 
     Returns:
         app: otbApplication object
 
     """
-    app = otbApplication.Registry.CreateApplication("RadiometricIndices")
+    import otbApplication
 
-    app.SetParameterString("in", input_file)
+    if app is None:
+        app = otbApplication.Registry.CreateApplication("RadiometricIndices")
+
+    if isinstance(input_file, str):
+        app.SetParameterString("in", input_file)
+    else:
+        app.SetParameterInputImage("in", input_file)
     app.SetParameterInt("channels.nir", nir_band_nb)
     app.SetParameterInt("channels.red", red_band_nb)
     app.SetParameterStringList("list", radiometric_indices)
     app.SetParameterString("out", output_file)
 
-    app.ExecuteAndWriteOutput()
+    if action == 'exe':
+        app.Execute()
+    elif action == 'write&exe':
+        app.ExecuteAndWriteOutput()
 
     return app
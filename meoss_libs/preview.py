@@ -0,0 +1,217 @@
+import logging
+import os
+
+import numpy as np
+
+from osgeo import gdal, gdal_array
+
+logger = logging.getLogger('PREVIEW')
+
+
+# 10 m products -> 60 m previews
+PREVIEW_FACTOR = 6
+
+# colour map of the quick-looks, linearly interpolated between these NDVI values (red -> yellow -> green)
+NDVI_COLORS = [(-1., (165, 0, 38)), (0., (255, 255, 191)), (0.5, (102, 189, 99)), (1., (0, 104, 55))]
+
+
+def preview_file_names(output_file, quicklook_format='png'):
+    """
+    Names of the preview and quick-look written next to a product. They are separated from the product name by a dot
+    and not an underscore, so they can not be read back as products by parse_output_file_name (e.g. by the mosaic and
+    change modes, which would take the preview for a product with a 'preview' suffix).
+
+    Examples:
+        >>> preview_file_names('/var/res/NDVI_T31TCJ_20231012T105856.tif')
+        will return ('/var/res/NDVI_T31TCJ_20231012T105856.preview.tif', '/var/res/NDVI_T31TCJ_20231012T105856.quicklook.png')
+    """
+    root = os.path.splitext(output_file)[0]
+    return f"{root}.preview.tif", f"{root}.quicklook.{quicklook_format}"
+
+
+class PreviewAccumulator:
+    """
+    Build a reduced resolution preview of an image from the blocks of the image, while they are computed.
+
+    Each block is reduced (average of the valid pixels of each factor x factor cell, or the upper left pixel of the
+    cell when decimating) and added to the preview, so the full resolution image is never read again. Blocks can have
+    any size and position: cells shared by two blocks are completed by the second one.
+
+    Examples:
+        >>> accumulator = PreviewAccumulator(xsize, ysize, factor=6, nodata=0)
+        >>> for (xoff, yoff, _, _), block in blocks:
+        >>>     accumulator.add(block, xoff, yoff)
+        >>> preview = accumulator.result()
+    """
+
+    def __init__(self, xsize, ysize, factor=PREVIEW_FACTOR, nodata=None, method='average'):
+        if method not in ['average', 'decimate']:
+            raise ValueError(f"preview method {method} not recognized, it can be: average, decimate")
+
+        self.factor = factor
+        self.nodata = nodata
+        self.method = method
+        self.dtype = None
+        shape = (-(-ysize // factor), -(-xsize // factor))
+        self.sums = np.zeros(shape, dtype=np.float64)
+        self.counts = np.zeros(shape, dtype=np.int32)
+
+    def add(self, block, xoff, yoff):
+        """
+        Add a block of the image to the preview. Pixels at nodata and non finite pixels (nan, inf) are not valid.
+
+        Args:
+            block: numpy array of the block.
+            xoff, yoff: position of the block in the image (pixels).
+        """
+        # cells without valid pixels are set to nodata in the preview: integer types have no nan to fall back on
+        if self.nodata is None and not np.issubdtype(block.dtype, np.floating):
+            raise ValueError(f"a nodata value is required for the preview of {block.dtype} images")
+
+        self.dtype = block.dtype
+        if np.issubdtype(block.dtype, np.floating):
+            valid = np.isfinite(block)
+            if self.nodata is not None and np.isfinite(self.nodata):
+                valid &= block != self.nodata
+        else:
+            valid = block != self.nodata
+
+        rows = (np.arange(block.shape[0]) + yoff) // self.factor
+        cols = (np.arange(block.shape[1]) + xoff) // self.factor
+
+        if self.method == 'decimate':
+            keep_rows = (np.arange(block.shape[0]) + yoff) % self.factor == 0
+            keep_cols = (np.arange(block.shape[1]) + xoff) % self.factor == 0
+            block = block[keep_rows][:, keep_cols]
+            valid = valid[keep_rows][:, keep_cols]
+            rows, cols = rows[keep_rows], cols[keep_cols]
+            self.sums[np.ix_(rows, cols)] += np.where(valid, block, 0)
+            self.counts[np.ix_(rows, cols)] += valid
+            return
+
+        # sums and counts of the valid pixels of each cell, first along lines then along columns
+        row_starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+        col_starts = np.flatnonzero(np.r_[True, cols[1:] != cols[:-1]])
+        sums = np.add.reduceat(np.add.reduceat(np.where(valid, block, 0).astype(np.float64), row_starts, axis=0), col_starts, axis=1)
+        counts = np.add.reduceat(np.add.reduceat(valid.astype(np.int32), row_starts, axis=0), col_starts, axis=1)
+
+        self.sums[np.ix_(rows[row_starts], cols[col_starts])] += sums
+        self.counts[np.ix_(rows[row_starts], cols[col_starts])] += counts
+
+    def result(self):
+        """
+        Return the preview, of the type of the blocks (rounded for integer types) and nodata (nan for float types
+        without nodata) where no pixel is valid.
+        """
+        nodata = np.nan if self.nodata is None else self.nodata
+        preview = np.full(self.sums.shape, nodata, dtype=np.float64)
+        np.divide(self.sums, self.counts, out=preview, where=self.counts > 0)
+
+        if self.dtype is not None and not np.issubdtype(self.dtype, np.floating):
+            preview = np.where(self.counts > 0, np.rint(preview), nodata)
+
+        return preview.astype(self.dtype or np.float32)
+
+
+def ndvi_colors(ndvi):
+    """
+    Colour map a NDVI array (values in [-1, 1], nan for nodata).
+
+    Returns:
+        numpy.ndarray: (4, lines, columns) uint8 RGBA array, transparent where ndvi is nan.
+    """
+    values = [value for value, _ in NDVI_COLORS]
+    rgba = np.zeros((4,) + ndvi.shape, dtype=np.uint8)
+
+    for channel in range(3):
+        rgba[channel] = np.interp(np.nan_to_num(ndvi), values, [color[channel] for _, color in NDVI_COLORS])
+    rgba[3] = np.where(np.isnan(ndvi), 0, 255)
+
+    return rgba
+
+
+def write_preview(output_file, preview, transform, projection, factor=PREVIEW_FACTOR, scale=1., offset=0., nodata=None,
+                  quicklook_format='png'):
+    """
+    Write the preview of a product (GeoTIFF at the preview resolution, same type, scale, offset and nodata as the
+    product) and its colour mapped quick-look (PNG or JPEG, world file included) next to the product.
+
+    Args:
+        output_file: Absolute path to the product.
+        preview: numpy array of the preview, as returned by PreviewAccumulator.result().
+        transform: geotransform of the product.
+        projection: projection of the product.
+        factor: reduction factor of the preview.
+        scale, offset: NDVI = value * scale + offset.
+        nodata: nodata value of the product.
+        quicklook_format: 'png' or 'jpeg'.
+
+    Returns:
+        tuple: paths of the preview and of the quick-look.
+    """
+    preview_file, quicklook_file = preview_file_names(output_file, quicklook_format)
+    preview_transform = [transform[0], transform[1] * factor, transform[2], transform[3], transform[4], transform[5] * factor]
+
+    data_set = gdal.GetDriverByName('GTiff').Create(preview_file, preview.shape[1], preview.shape[0], 1,
+                                                    gdal_array.NumericTypeCodeToGDALTypeCode(preview.dtype), options=['COMPRESS=DEFLATE'])
+    data_set.SetGeoTransform(preview_transform)
+    data_set.SetProjection(projection)
+    band = data_set.GetRasterBand(1)
+    band.SetScale(scale)
+    band.SetOffset(offset)
+    if nodata is not None:
+        band.SetNoDataValue(nodata)
+    band.WriteArray(preview)
+    data_set = None
+
+    ndvi = preview.astype(np.float64) * scale + offset
+    if nodata is not None:
+        ndvi[preview == nodata] = np.nan
+    rgba = ndvi_colors(ndvi)
+
+    # JPEG has no alpha channel, nodata is left black
+    if quicklook_format != 'png':
+        rgba = rgba[:3] * (rgba[3] > 0)
+
+    memory = gdal.GetDriverByName('MEM').Create('', preview.shape[1], preview.shape[0], rgba.shape[0], gdal.GDT_Byte)
+    memory.SetGeoTransform(preview_transform)
+    memory.SetProjection(projection)
+    for idx_band in range(rgba.shape[0]):
+        memory.GetRasterBand(idx_band + 1).WriteArray(rgba[idx_band])
+
+    gdal.GetDriverByName(quicklook_format.upper()).CreateCopy(quicklook_file, memory, options=['WORLDFILE=YES'])
+    memory = None
+
+    logger.debug("preview %s and quick-look %s created", preview_file, quicklook_file)
+    return preview_file, quicklook_file
+
+
+def write_preview_from_file(output_file, factor=PREVIEW_FACTOR, quicklook_format='png', block_size=512):
+    """
+    Build the preview and quick-look of a product already written (e.g. by OTB, whose streaming does not expose its
+    blocks to python). The product is read again once by blocks, right after being written: this costs a full extra
+    read of the product, that is why the CLI only does it on request (--preview-reread).
+    Integer products without nodata use 0 as nodata, as the mosaic mode.
+
+    Args:
+        output_file: Absolute path to the product.
+        factor: reduction factor of the preview.
+        quicklook_format: 'png' or 'jpeg'.
+        block_size: number of lines read per block.
+
+    Returns:
+        tuple: paths of the preview and of the quick-look.
+    """
+    data_set = gdal.Open(output_file, gdal.GA_ReadOnly)
+    band = data_set.GetRasterBand(1)
+    nodata = band.GetNoDataValue()
+    if nodata is None and band.DataType not in (gdal.GDT_Float32, gdal.GDT_Float64):
+        nodata = 0
+    accumulator = PreviewAccumulator(data_set.RasterXSize, data_set.RasterYSize, factor, nodata)
+
+    for yoff in range(0, data_set.RasterYSize, block_size):
+        ysize = min(block_size, data_set.RasterYSize - yoff)
+        accumulator.add(band.ReadAsArray(0, yoff, data_set.RasterXSize, ysize), 0, yoff)
+
+    return write_preview(output_file, accumulator.result(), data_set.GetGeoTransform(), data_set.GetProjection(), factor,
+                         band.GetScale() or 1., band.GetOffset() or 0., nodata, quicklook_format)
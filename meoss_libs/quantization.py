@@ -0,0 +1,109 @@
+"""
+Output data types of the NDVI products.
+
+The NDVI (in [-1, 1]) is stored as value = (ndvi - offset) / scale, truncated and clipped to [min, max] for integer
+types, so that readers get the NDVI back with the GDAL convention ndvi = value * scale + offset.
+Masked pixels (clouds) are set to nodata. scale, offset and nodata are written in the GDAL metadata of the products.
+
+gdal is only imported when metadata are written: this module is used by the CLI to build the processing
+expressions and must stay cheap to import.
+"""
+
+OUTPUT_DTYPES = {
+    # historical band mode output: NDVI x 1000, masked pixels set to -32768 (0 is a valid NDVI: bare soil, water)
+    'int16': {'scale': 0.001, 'offset': 0., 'nodata': -32768, 'min': -1000, 'max': 1000, 'numpy': 'int16', 'gdal': 'Int16', 'otb': 'int16'},
+    # NDVI from -1 to 1 on 0 to 250 (0.008 step), 255 is nodata
+    'uint8': {'scale': 0.008, 'offset': -1., 'nodata': 255, 'min': 0, 'max': 250, 'numpy': 'uint8', 'gdal': 'Byte', 'otb': 'uint8'},
+    # historical concat mode output: NDVI not scaled
+    'float32': {'scale': 1., 'offset': 0., 'nodata': -9999., 'min': None, 'max': None, 'numpy': 'float32', 'gdal': 'Float32', 'otb': 'float'},
+}
+
+# reflectances of the MAJA products (S2-2A, S2-3A) are set to -10000 where the pixel was not observed (edge of the
+# swath, saturation): NDVI computed from them are meaningless, the output pixels are set to the nodata value
+INPUT_NODATA = -10000
+
+
+def get_output_dtype(out_dtype):
+    """
+    Return the specification of an output data type.
+
+    Args:
+        out_dtype: output data type name. It can be: int16, uint8, float32.
+
+    Returns:
+        dict: 'scale', 'offset', 'nodata', valid range 'min' and 'max' (None for float types) and the data type names
+            in 'numpy', 'gdal' and 'otb'.
+    """
+    if out_dtype not in OUTPUT_DTYPES:
+        raise ValueError(f"output data type {out_dtype} not recognized, it can be: {', '.join(OUTPUT_DTYPES)}")
+
+    return OUTPUT_DTYPES[out_dtype]
+
+
+def quantization_coefficients(out_dtype):
+    """
+    Gain and bias to apply to the NDVI to get the stored value: value = ndvi * gain + bias.
+
+    Examples:
+        >>> quantization_coefficients('uint8')
+        will return (125.0, 125.0)
+    """
+    spec = get_output_dtype(out_dtype)
+    return 1 / spec['scale'], -spec['offset'] / spec['scale']
+
+
+def bandmath_quantization_expression(expression, out_dtype):
+    """
+    Fuse the quantization in an OTB BandMath (muParser) expression computing a NDVI.
+
+    Args:
+        expression: BandMath expression of the NDVI.
+        out_dtype: output data type name.
+
+    Returns:
+        str: BandMath expression of the stored value.
+
+    Examples:
+        >>> bandmath_quantization_expression('(im1b1-im2b1)/(im1b1+im2b1+1.E-6)', 'int16')
+        will return 'min(max((im1b1-im2b1)/(im1b1+im2b1+1.E-6)*1000.0,-1000),1000)'
+    """
+    spec = get_output_dtype(out_dtype)
+    gain, bias = quantization_coefficients(out_dtype)
+
+    expression = f"{expression}*{gain}" if gain != 1 else expression
+    expression = f"{expression}+{bias}" if bias != 0 else expression
+
+    if spec['min'] is not None:
+        expression = f"min(max({expression},{spec['min']}),{spec['max']})"
+
+    return expression
+
+
+def write_quantization_metadata(file, out_dtype):
+    """
+    Write scale, offset and nodata of an output data type in the metadata of an image (first band).
+    Only the metadata are updated, pixels are not read.
+
+    Args:
+        file: Absolute path to the image.
+        out_dtype: output data type name.
+    """
+    from osgeo import gdal
+
+    data_set = gdal.Open(file, gdal.GA_Update)
+    if data_set is None:
+        raise IOError(f"unable to open {file}")
+
+    apply_quantization_metadata(data_set.GetRasterBand(1), out_dtype)
+    data_set = None
+
+
+def apply_quantization_metadata(band, out_dtype):
+    """
+    Set scale, offset and nodata of an output data type on a gdal.Band.
+    """
+    spec = get_output_dtype(out_dtype)
+
+    band.SetScale(spec['scale'])
+    band.SetOffset(spec['offset'])
+    band.SetNoDataValue(spec['nodata'])
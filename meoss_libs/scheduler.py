@@ -0,0 +1,345 @@
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger('SCHEDULER')
+
+
+# costs used until a format and backend have a history: seconds per megapixel and peak memory in bytes per pixel of a
+# scene
+DEFAULT_COSTS = {'S2-2A-ESA': {'seconds_per_mpixel': 0.5, 'bytes_per_pixel': 12.},
+                 'S2-2A': {'seconds_per_mpixel': 0.2, 'bytes_per_pixel': 8.},
+                 'S2-3A': {'seconds_per_mpixel': 0.2, 'bytes_per_pixel': 8.},
+                 'concat': {'seconds_per_mpixel': 0.2, 'bytes_per_pixel': 8.}}
+
+# weight of the last measure in the moving average of the costs
+HISTORY_WEIGHT = 0.3
+
+# size of a full Sentinel-2 tile at 10 m, used for the scenes whose size can not be read
+DEFAULT_PIXELS = 10980 * 10980
+
+# status returned by the scene functions: skipped (output already there) and failed scenes are not measured
+SCENE_CREATED = 'created'
+SCENE_SKIPPED = 'skipped'
+SCENE_FAILED = 'failed'
+
+
+def physical_memory():
+    """
+    Physical memory of the host in bytes, None if it can not be read (os.sysconf is Unix only).
+    """
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def scene_pixels(image, shape_file=None):
+    """
+    Number of pixels processed for a scene, from the image header only (no pixel is read): size of the image, reduced
+    to the fraction of the image covered by the extent of the shape file when the output is clipped.
+
+    Args:
+        image: Absolute path to the reference image of the scene (e.g. its B8 band).
+        shape_file: Absolute path to the shape file used to clip the output, optional.
+
+    Returns:
+        int: number of pixels.
+    """
+    from osgeo import gdal, ogr
+
+    data_set = gdal.Open(image, gdal.GA_ReadOnly)
+    if data_set is None:
+        raise IOError(f"unable to open {image}")
+
+    pixels = data_set.RasterXSize * data_set.RasterYSize
+    if not shape_file:
+        return pixels
+
+    vector = ogr.Open(shape_file)
+    if vector is None:
+        raise IOError(f"unable to open shape file {shape_file}")
+    xmin, xmax, ymin, ymax = vector.GetLayer(0).GetExtent()
+
+    transform = data_set.GetGeoTransform()
+    image_xmin, image_ymax = transform[0], transform[3]
+    image_xmax = image_xmin + transform[1] * data_set.RasterXSize
+    image_ymin = image_ymax + transform[5] * data_set.RasterYSize
+
+    width = max(0., min(xmax, image_xmax) - max(xmin, image_xmin))
+    height = max(0., min(ymax, image_ymax) - max(ymin, image_ymin))
+    fraction = width * height / ((image_xmax - image_xmin) * (image_ymax - image_ymin))
+
+    return int(pixels * fraction)
+
+
+def history_key(img_format, backend=None):
+    """
+    Key of the costs of a format and backend in the history: the backends (e.g. otb and numpy) of a same format do not
+    have the same costs.
+
+    Examples:
+        >>> history_key('S2-2A', 'numpy')
+        will return 'S2-2A/numpy'
+    """
+    return f"{img_format}/{backend}" if backend else img_format
+
+
+class CostHistory:
+    """
+    Cost of the scenes of each format and backend (seconds per megapixel and peak memory per pixel), kept in a JSON
+    file from one run to the next. Each measure updates a moving average of the costs of its format and backend, those
+    without history use the DEFAULT_COSTS of the format.
+
+    Examples:
+        >>> history = CostHistory('/var/res/.ndvi_cost_history.json')
+        >>> seconds, memory = history.estimate('S2-2A', 120560400, 'numpy')
+        >>> history.update('S2-2A', 120560400, 25.3, 950000000, 'numpy')
+        >>> history.save()
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.costs = {}
+
+        if path and os.path.exists(path):
+            try:
+                with open(path) as history_file:
+                    self.costs = json.load(history_file)
+            except (OSError, ValueError) as e:
+                logger.warning(f"cost history {path} ignored, unable to read it: {e}")
+
+    def cost(self, img_format, backend=None):
+        """
+        Costs of a format and backend: {'seconds_per_mpixel': ..., 'bytes_per_pixel': ...}
+        """
+        return {**DEFAULT_COSTS.get(img_format, DEFAULT_COSTS['concat']), **self.costs.get(history_key(img_format, backend), {})}
+
+    def estimate(self, img_format, pixels, backend=None):
+        """
+        Estimated duration (seconds) and peak memory (bytes) of a scene, of DEFAULT_PIXELS pixels if pixels is None.
+        """
+        pixels = DEFAULT_PIXELS if pixels is None else pixels
+        cost = self.cost(img_format, backend)
+        return cost['seconds_per_mpixel'] * pixels / 1e6, cost['bytes_per_pixel'] * pixels
+
+    def update(self, img_format, pixels, duration, peak_memory=None, backend=None):
+        """
+        Add the measure of a scene to the history of its format and backend.
+
+        Args:
+            img_format: format of the scene.
+            pixels: number of pixels of the scene (see scene_pixels), None if unknown (the measure is then ignored).
+            duration: measured duration in seconds.
+            peak_memory: measured peak memory in bytes, None if it could not be measured.
+            backend: computation backend of the scene (e.g. 'otb', 'numpy').
+        """
+        if pixels is None or pixels <= 0:
+            return
+
+        key = history_key(img_format, backend)
+        cost = self.cost(img_format, backend)
+        measures = {'seconds_per_mpixel': duration / pixels * 1e6}
+        if peak_memory is not None:
+            measures['bytes_per_pixel'] = peak_memory / pixels
+
+        known = key in self.costs
+        for measure, value in measures.items():
+            cost[measure] = (1 - HISTORY_WEIGHT) * cost[measure] + HISTORY_WEIGHT * value if known else value
+        cost['count'] = cost.get('count', 0) + 1
+
+        self.costs[key] = cost
+
+    def save(self):
+        """
+        Write the history in its JSON file (replaced atomically).
+        """
+        if not self.path:
+            return
+
+        temporary_file = f"{self.path}.{os.getpid()}.tmp"
+        with open(temporary_file, 'w') as history_file:
+            json.dump(self.costs, history_file, indent=2)
+        os.replace(temporary_file, self.path)
+
+
+class ScheduledScene:
+    """
+    A scene to process: the function and arguments to call in a worker process, its format, its backend and its size
+    (number of pixels, None if unknown: its cost is estimated for DEFAULT_PIXELS and it is not added to the history).
+    """
+
+    def __init__(self, function, args, img_format, pixels, name='', backend=None):
+        self.function = function
+        self.args = args
+        self.img_format = img_format
+        self.backend = backend
+        self.pixels = pixels
+        self.name = name
+        self.seconds = 0.
+        self.memory = 0.
+
+
+def current_rss():
+    """
+    Resident memory of the current process in bytes, None if it can not be read (/proc is Linux only).
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, OSError, ValueError, IndexError):
+        return None
+
+
+def reset_peak_rss():
+    """
+    Reset the peak resident memory of the current process (VmHWM) to its current resident memory, so that the peak of
+    the next scene can be read by peak_rss.
+
+    Returns:
+        bool: False if the peak can not be reset (Linux 4.0 or later only).
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss():
+    """
+    Peak resident memory of the current process in bytes (VmHWM), None if it can not be read (/proc is Linux only).
+    """
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def run_scene(function, args):
+    """
+    Run a scene in a worker process and measure it.
+
+    The peak memory is the increase of the resident memory of the worker during the scene: the peak of the worker
+    (VmHWM) is reset to its current resident memory before the scene, so every scene of a worker is measured. Where it
+    can not be reset, the increase of the maximum resident memory (resource module) is used: a worker which already
+    reached a higher peak with a previous scene can not measure it, the peak is then None. It is also None where the
+    resource module (Unix only) or /proc (Linux only) are not available.
+
+    Returns:
+        tuple: (result of function, duration in seconds, peak memory in bytes or None)
+    """
+    rss_start = current_rss()
+    reset = rss_start is not None and reset_peak_rss()
+
+    resource = None
+    if not reset:
+        try:
+            import resource
+        except ImportError:
+            pass
+    max_rss_start = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else None
+
+    start = time.perf_counter()
+    result = function(*args)
+    duration = time.perf_counter() - start
+
+    peak = None
+    if reset:
+        max_rss = peak_rss()
+        peak = max(max_rss - rss_start, 0) if max_rss is not None else None
+    elif resource and rss_start is not None:
+        # ru_maxrss is in kilobytes on Linux
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak = max_rss * 1024 - rss_start if max_rss > max_rss_start else None
+
+    return result, duration, peak
+
+
+def run_scheduled(scenes, workers, memory_budget=None, history=None, initializer=None, initargs=()):
+    """
+    Process scenes in a pool of worker processes, largest first, without exceeding a memory budget.
+
+    The duration and peak memory of each scene are estimated from its format, backend and number of pixels (see
+    CostHistory).
+    Scenes are started by decreasing estimated duration, so the longest scenes do not end last (stragglers). A scene
+    is only started if the estimated memory of the running scenes plus its own stays under memory_budget: while a large
+    scene does not fit, smaller scenes which fit are started. A scene larger than the budget runs alone.
+    Each measure updates the history, which is saved at the end: scenes whose function returns SCENE_SKIPPED or
+    SCENE_FAILED are not measured, their duration is not the cost of a computation. If a worker process dies (e.g.
+    killed when out of memory), the scenes not processed are logged, the history is saved and BrokenProcessPool is
+    raised.
+
+    Args:
+        scenes: list of ScheduledScene, their function returns a result or a SCENE_* status.
+        workers: number of worker processes.
+        memory_budget: maximum estimated memory of the running scenes in bytes, no limit if None.
+        history: CostHistory, a history without file is used if None.
+        initializer, initargs: initializer of the worker processes (e.g. setup_worker_logging and its queue).
+
+    Returns:
+        list: results of the scenes, in the order they ended.
+    """
+    history = history or CostHistory()
+    for scene in scenes:
+        scene.seconds, scene.memory = history.estimate(scene.img_format, scene.pixels, scene.backend)
+
+    pending = sorted(scenes, key=lambda scene: scene.seconds, reverse=True)
+    running = {}
+    results = []
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs) as executor:
+            while pending or running:
+                used = sum(scene.memory for scene in running.values())
+
+                while pending and len(running) < workers:
+                    scene = next((scene for scene in pending if memory_budget is None or used + scene.memory <= memory_budget), None)
+                    if scene is None and not running:
+                        scene = pending[0]
+                        logger.warning(f"{scene.name} estimated memory ({scene.memory / 1e9:.1f} GB) exceeds the budget, it runs alone")
+                    if scene is None:
+                        break
+
+                    running[executor.submit(run_scene, scene.function, scene.args)] = scene
+                    pending.remove(scene)
+                    used += scene.memory
+                    logger.debug("%s started, estimated %.1f s and %.2f GB, %d scene(s) running", scene.name, scene.seconds, scene.memory / 1e9, len(running))
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        result, duration, peak = future.result()
+                    except BrokenProcessPool:
+                        raise
+                    except Exception as e:
+                        logger.error(f"error while processing {running.pop(future).name}: {e}")
+                        continue
+
+                    scene = running.pop(future)
+                    results.append(result)
+                    if result in (SCENE_SKIPPED, SCENE_FAILED):
+                        logger.debug("%s %s, not added to the cost history", scene.name, result)
+                        continue
+
+                    history.update(scene.img_format, scene.pixels, duration, peak, scene.backend)
+                    logger.debug("%s done in %.1f s (estimated %.1f s)", scene.name, duration, scene.seconds)
+
+    except BrokenProcessPool:
+        # a worker died (e.g. killed by the system when out of memory): the pool can not run any other scene, the
+        # measures of the scenes already done are kept
+        lost = [scene.name for scene in list(running.values()) + pending]
+        logger.error(f"a worker process terminated abruptly (e.g. out of memory), {len(lost)} scene(s) not processed: {', '.join(lost)}")
+        history.save()
+        raise
+
+    history.save()
+    return results
@@ -23,23 +23,25 @@ to another range
 
 Simplified on Wednesday October 25 2023 for a recruitment test
 By : Agathe Fontaine
+
+Modified after the test for performance
+f_rescale broadcasts the ranges instead of allocating arrays of the image
+size, create_ndvi_image reads only the red and near infrared bands and can
+quantize the NDVI while it is computed (f_ndvi_quantized, added)
 """
-from osgeo import gdal
+from osgeo import gdal, gdal_array
 from os.path import join, normcase
-from sys import path
 
 import numpy as np
 
-import file_management
-
-# Path to personal libraries
-scripts_folder = '/media/tech/Recrutement_test_dev/cas1_env-afo/'
-scripts_folder = normcase(scripts_folder)
-path.append(scripts_folder)
+from meoss_libs import file_management
+from meoss_libs.quantization import get_output_dtype, quantization_coefficients, write_quantization_metadata
 
 
 #################################################
-# CODE NOT MODIFIED AS NOT IN SCOPE OF THE TEST #
+# CODE NOT IN SCOPE OF THE TEST                 #
+# f_rescale and create_ndvi_image modified      #
+# since, for performance (see the file header)  #
 #################################################
 
 
@@ -63,15 +65,13 @@ def f_rescale(in_array, range1, range2):
 
     """
 
-    range1_min_array = range1[0] * np.ones((in_array.shape[0], in_array.shape[1]))
+    # ranges are broadcast as scalars instead of arrays of the image size,
+    # the computation is still done in float64 (same results as before)
+    in_array = np.asanyarray(in_array, dtype=np.promote_types(in_array.dtype, np.float64))
     delta1 = range1[1] - range1[0]
-    delta1_array = delta1 * np.ones((in_array.shape[0], in_array.shape[1]))
-
-    range2_min_array = range2[0] * np.ones((in_array.shape[0], in_array.shape[1]))
     delta2 = range2[1] - range2[0]
-    delta2_array = delta2 * np.ones((in_array.shape[0], in_array.shape[1]))
 
-    return (delta2_array * (in_array - range1_min_array) / delta1_array) + range2_min_array
+    return (delta2 * (in_array - range1[0]) / delta1) + range2[0]
 
 
 # NDVI
@@ -96,10 +96,59 @@ def f_ndvi(red, nir):
     return (nir - red) / (nir + red)
 
 
+def f_ndvi_quantized(red, nir, out_dtype, mask=None):
+    """
+    This function allows to calculate NDVI from Numpy arrays, directly
+    quantized to an output data type (see meoss_libs.quantization): the
+    NDVI is computed in float64 as f_ndvi, and scaled, truncated and clipped
+    in place, without temporary arrays nor separate rescaling pass.
+
+    Input parameters
+    -----------------
+    red : numpy array corresponding to the red band
+    nir : numpy array corresponding to the near infra-red band
+    out_dtype : str, output data type (int16, uint8, float32)
+    mask : boolean numpy array, True for the pixels set to nodata (optional)
+
+    Return
+    -------
+    ndvi : numpy array of out_dtype type, nodata where masked or where
+        nir + red is 0
+    """
+    spec = get_output_dtype(out_dtype)
+    gain, bias = quantization_coefficients(out_dtype)
+
+    red = red.astype(np.float64)
+    ndvi = nir.astype(np.float64)
+    denominator = ndvi + red
+    ndvi -= red
+    del red
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ndvi /= denominator
+    invalid = denominator == 0
+    del denominator
+
+    if gain != 1:
+        ndvi *= gain
+    if bias != 0:
+        ndvi += bias
+    if spec['min'] is not None:
+        np.trunc(ndvi, out=ndvi)
+        np.clip(ndvi, spec['min'], spec['max'], out=ndvi)
+
+    if mask is not None:
+        invalid |= mask
+    ndvi[invalid] = spec['nodata']
+
+    return ndvi.astype(spec['numpy'], copy=False)
+
+
 def create_ndvi_image(image, images_folder, work_folder, ndvi_filename,
                       nir_band, red_band, in_nodata_value=None, out_nodata_value=None,
                       rescale=False, range1=None, range2=None,
-                      gdal_dtype=gdal.GDT_Float32, driver_name='GTiff'):
+                      gdal_dtype=gdal.GDT_Float32, driver_name='GTiff', preview=None,
+                      out_dtype=None):
     """
     This procedure allows to create a NDVI image from an input image.
     The created image is in .tif format.
@@ -130,25 +179,56 @@ def create_ndvi_image(image, images_folder, work_folder, ndvi_filename,
         In GDAL format (GDT_Byte, GDT_Int8, GDT_UInt16, GDT_Int16...)
     driver_name : str (default = 'GTiff')
         Any driver supported by GDAL.
+    preview : str (default = None)
+        Quick-look format ('png' or 'jpeg'). If set, a 60 m preview and a
+        colour mapped quick-look are built from the NDVI array in memory
+        and written next to the NDVI image.
+    out_dtype : str (default = None)
+        Output data type of meoss_libs.quantization (int16, uint8, float32).
+        If set, the NDVI is quantized while it is computed (see
+        f_ndvi_quantized) and scale, offset and nodata are written in the
+        metadata: rescale, range1, range2, gdal_dtype and out_nodata_value
+        are then ignored.
     """
 
     # Opening with GDAL
     # dataset = gdal.Open(normcase(join(images_folder,image)))
     dataset = file_management.open_image(normcase(join(images_folder, image)))
 
-    # Read each band as an array and convert to float for calculations
+    # NDVI quantized while it is computed, scale, offset and nodata in the metadata
+    if out_dtype is not None:
+        spec = get_output_dtype(out_dtype)
+        red = dataset.GetRasterBand(red_band + 1).ReadAsArray()
+        nir = dataset.GetRasterBand(nir_band + 1).ReadAsArray()
+        mask_nodata = red == in_nodata_value if in_nodata_value is not None else None
+
+        ndvi = f_ndvi_quantized(red, nir, out_dtype, mask_nodata)
+        del red, nir
+
+        out_filename = normcase(join(work_folder, ndvi_filename))
+        file_management.write_image(out_filename, ndvi, data_set=dataset,
+                       gdal_dtype=gdal.GetDataTypeByName(spec['gdal']), nb_band=1,
+                       nodata=spec['nodata'])
+        write_quantization_metadata(out_filename, out_dtype)
+
+        if preview:
+            from meoss_libs.preview import PreviewAccumulator, write_preview
+
+            accumulator = PreviewAccumulator(ndvi.shape[1], ndvi.shape[0], nodata=spec['nodata'])
+            accumulator.add(ndvi, 0, 0)
+            write_preview(out_filename, accumulator.result(), dataset.GetGeoTransform(), dataset.GetProjection(),
+                          scale=spec['scale'], offset=spec['offset'], nodata=spec['nodata'], quicklook_format=preview)
+        return
+
+    # Read the red and near infrared bands only and convert to float for calculations
+    # (the other bands of the image are not loaded)
     # Application of the No Data mask if necessary
+    red = dataset.GetRasterBand(red_band + 1).ReadAsArray().astype(float)
+    nir = dataset.GetRasterBand(nir_band + 1).ReadAsArray().astype(float)
     if in_nodata_value is not None:
-        image_array = dataset.ReadAsArray().astype(float)
-        red = image_array[red_band, :, :]
         mask_nodata = red == in_nodata_value
-        nir = image_array[nir_band, :, :]
         red = np.ma.masked_equal(red, in_nodata_value)
         nir = np.ma.masked_equal(nir, in_nodata_value)
-    else:
-        image_array = dataset.ReadAsArray().astype(float)
-        red = image_array[red_band, :, :]
-        nir = image_array[nir_band, :, :]
 
     # Application of the f_ndvi() function
     ndvi = f_ndvi(red, nir)
@@ -167,5 +247,22 @@ def create_ndvi_image(image, images_folder, work_folder, ndvi_filename,
                    driver_name=None, nb_col=None, nb_ligne=None, nb_band=1,
                    nodata=out_nodata_value)
 
+    # Preview built from the array in memory, the NDVI image is not read again
+    if preview:
+        from meoss_libs.preview import PreviewAccumulator, write_preview
+
+        ndvi_array = np.ma.getdata(ndvi).astype(gdal_array.GDALTypeCodeToNumericTypeCode(gdal_dtype))
+        accumulator = PreviewAccumulator(ndvi_array.shape[1], ndvi_array.shape[0], nodata=out_nodata_value)
+        accumulator.add(ndvi_array, 0, 0)
+
+        # NDVI = value * scale + offset when values have been rescaled from range1 to range2
+        scale, offset = 1., 0.
+        if rescale:
+            scale = (range1[1] - range1[0]) / (range2[1] - range2[0])
+            offset = range1[0] - range2[0] * scale
+
+        write_preview(normcase(join(work_folder, ndvi_filename)), accumulator.result(), dataset.GetGeoTransform(),
+                      dataset.GetProjection(), scale=scale, offset=offset, nodata=out_nodata_value, quicklook_format=preview)
+
     # Delete array
     del ndvi
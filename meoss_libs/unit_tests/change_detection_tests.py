@@ -0,0 +1,82 @@
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from osgeo import gdal
+
+from meoss_libs.change_detection import change_block, ndvi_change, DELTA_NODATA, CHANGE_NODATA, CHANGE_NONE, CHANGE_LOSS, CHANGE_GAIN
+from meoss_libs.quantization import get_output_dtype
+from meoss_libs.unit_tests.synthetic_images import create_ndvi
+
+# avoid non pertinent log messages
+logger = logging.getLogger('CHANGE DETECTION')
+logger.disabled = True
+
+# nodata of the int16 band mode output
+NODATA = get_output_dtype('int16')['nodata']
+
+
+class TestChangeBlock(unittest.TestCase):
+    """
+    Test the change_block function
+    """
+
+    def test_change_block(self):
+        ndvi1 = np.array([[0.8, 0.2, np.nan, 0.5]], dtype=np.float32)
+        ndvi2 = np.array([[0.3, 0.6, 0.4, np.nan]], dtype=np.float32)
+
+        delta, change = change_block(ndvi1, ndvi2, threshold=0.3)
+        np.testing.assert_array_equal(delta, [[-500, 400, DELTA_NODATA, DELTA_NODATA]])
+        np.testing.assert_array_equal(change, [[CHANGE_LOSS, CHANGE_GAIN, CHANGE_NODATA, CHANGE_NODATA]])
+
+    def test_below_threshold(self):
+        _, change = change_block(np.array([[0.5]]), np.array([[0.45]]), threshold=0.2)
+        np.testing.assert_array_equal(change, [[CHANGE_NONE]])
+
+
+class TestNdviChange(unittest.TestCase):
+    """
+    Test the ndvi_change function on synthetic NDVI images
+    """
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        rng = np.random.default_rng(0)
+
+        self.ndvi1 = rng.integers(-1000, 1000, (70, 50), dtype=np.int16)
+        self.ndvi2 = rng.integers(-1000, 1000, (70, 50), dtype=np.int16)
+        self.ndvi1[5:10] = 0        # bare soil, valid NDVI
+        self.ndvi1[:5] = NODATA     # masked at the first date
+        self.ndvi2[:, :5] = NODATA  # masked at the second date
+
+        self.file1 = os.path.join(self.test_dir, 'NDVI_T31TCJ_20231012T105856.tif')
+        self.file2 = os.path.join(self.test_dir, 'NDVI_T31TCJ_20231017T105859.tif')
+        create_ndvi(self.file1, self.ndvi1)
+        create_ndvi(self.file2, self.ndvi2)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_ndvi_change(self):
+        delta_file = os.path.join(self.test_dir, 'delta.tif')
+        change_file = os.path.join(self.test_dir, 'change.tif')
+        ndvi_change(self.file1, self.file2, delta_file, change_file, threshold=0.2, block_size=16, threads=3)
+
+        valid = (self.ndvi1 != NODATA) & (self.ndvi2 != NODATA)
+        reference = self.ndvi2.astype(np.int32) - self.ndvi1
+
+        delta = gdal.Open(delta_file).ReadAsArray()
+        change = gdal.Open(change_file).ReadAsArray()
+        np.testing.assert_array_equal(delta[valid], reference[valid])
+        np.testing.assert_array_equal(delta[~valid], DELTA_NODATA)
+        np.testing.assert_array_equal(change[~valid], CHANGE_NODATA)
+        np.testing.assert_array_equal(change[valid & (reference <= -200)], CHANGE_LOSS)
+        np.testing.assert_array_equal(change[valid & (reference >= 200)], CHANGE_GAIN)
+        np.testing.assert_array_equal(change[valid & (np.abs(reference) < 200)], CHANGE_NONE)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+
+import numpy as np
+
+from meoss_libs.cloud_mask import decode_cloud_mask, dilate, halo_window
+
+
+class TestDecodeCloudMask(unittest.TestCase):
+    """
+    Test the decode_cloud_mask function
+    """
+
+    def test_clm_all_bits(self):
+        mask = np.array([[0, 1, 16, 128]], dtype=np.uint8)
+        np.testing.assert_array_equal(decode_cloud_mask(mask, 'S2-2A'), [[False, True, True, True]])
+
+    def test_clm_selected_bits(self):
+        # bit 4 (thinnest clouds) is not selected: pixels flagged only by this bit stay valid
+        mask = np.array([[0, 1, 16, 17, 32]], dtype=np.uint8)
+        np.testing.assert_array_equal(decode_cloud_mask(mask, 'S2-2A', cloud_bits=[0, 5]), [[False, True, False, True, True]])
+
+    def test_flg_valid_flags(self):
+        mask = np.array([[0, 1, 2, 3, 4]], dtype=np.uint8)
+        np.testing.assert_array_equal(decode_cloud_mask(mask, 'S2-3A'), [[True, True, True, True, False]])
+        np.testing.assert_array_equal(decode_cloud_mask(mask, 'S2-3A', valid_flags=[3, 4]), [[True, True, True, False, False]])
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            decode_cloud_mask(np.zeros((1, 1)), 'L8')
+
+
+class TestDilate(unittest.TestCase):
+    """
+    Test the dilate and halo_window functions
+    """
+
+    def setUp(self):
+        self.mask = np.random.default_rng(0).random((37, 29)) > 0.97
+
+    def reference_dilate(self, mask, radius):
+        reference = np.zeros_like(mask)
+        for row, col in zip(*np.nonzero(mask)):
+            reference[max(row - radius, 0):row + radius + 1, max(col - radius, 0):col + radius + 1] = True
+        return reference
+
+    def test_dilate(self):
+        for radius in [0, 1, 4]:
+            np.testing.assert_array_equal(dilate(self.mask, radius), self.reference_dilate(self.mask, radius))
+
+    def test_dilate_by_blocks(self):
+        # blocks of 5 lines of a window, each dilated with its halo
+        radius = 3
+        expected = dilate(self.mask, radius)[2:33, 4:24]
+
+        blocks = []
+        for yoff in range(2, 33, 5):
+            block = (4, yoff, 20, min(5, 33 - yoff))
+            (xoff, top, xsize, ysize), (col, row) = halo_window(block, radius, 29, 37)
+            dilated = dilate(self.mask[top:top + ysize, xoff:xoff + xsize], radius)
+            blocks.append(dilated[row:row + block[3], col:col + block[2]])
+
+        np.testing.assert_array_equal(np.vstack(blocks), expected)
+
+    def test_halo_window_clamped(self):
+        self.assertEqual(halo_window((0, 10, 20, 5), 3, 22, 16), ((0, 7, 22, 9), (0, 3)))
+
+
+if __name__ == '__main__':
+    unittest.main()
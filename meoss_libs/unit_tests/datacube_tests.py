@@ -0,0 +1,124 @@
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import numpy as np
+import zarr
+
+from meoss_libs.datacube import append_rows, datacube_path, datacube_lock, date_seconds, VARIABLE, TIME, ZARR_V3
+
+# avoid non pertinent log messages
+logger = logging.getLogger('DATACUBE')
+logger.disabled = True
+
+GEOTRANSFORM = (300000, 10, 0, 4800000, 0, -10)
+
+
+class TestDatacube(unittest.TestCase):
+    """
+    Test the datacube_path, datacube_lock and append_rows functions
+    """
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.test_dir, 'NDVI_T31TCJ_CUBE.zarr')
+        self.scene = np.arange(40 * 30, dtype=np.int16).reshape(40, 30)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def append(self, date, scene, geotransform=GEOTRANSFORM):
+        return append_rows(self.path, date, lambda yoff, ysize: scene[yoff:yoff + ysize], scene.shape[1], scene.shape[0],
+                           scene.dtype, 0, geotransform, 'projection', 0.001, 0., chunks=(4, 16, 16))
+
+    def cube(self):
+        return zarr.open_array(os.path.join(self.path, VARIABLE), mode='r')
+
+    def times(self):
+        return zarr.open_array(os.path.join(self.path, TIME), mode='r')[:]
+
+    def test_datacube_path(self):
+        self.assertEqual(datacube_path('/res/NDVI_T31TCJ_20231012T105856.tif'), '/res/NDVI_T31TCJ_CUBE.zarr')
+        self.assertEqual(datacube_path('/res/NDVI_T31TCJ_20231012T105856.tif', '/cubes'), '/cubes/NDVI_T31TCJ_CUBE.zarr')
+
+    def test_append_dates(self):
+        self.assertEqual(self.append('20231012T105856', self.scene), 0)
+        self.assertEqual(self.append('20231017T105859', self.scene + 1), 1)
+
+        cube = self.cube()
+        self.assertEqual(cube.shape, (2, 40, 30))
+        self.assertEqual(list(cube.attrs['dates']), ['20231012T105856', '20231017T105859'])
+        np.testing.assert_array_equal(self.times(), [date_seconds('20231012T105856'), date_seconds('20231017T105859')])
+        np.testing.assert_array_equal(cube[:, 39, 29], [self.scene[39, 29], self.scene[39, 29] + 1])
+        self.assertFalse(os.path.exists(f"{self.path}.lock"))
+
+    def test_append_out_of_order(self):
+        # dates processed out of order (e.g. by the scheduler workers) are appended in arrival order, the time
+        # coordinate gives their order and the scenes already in the cube are not rewritten
+        dates = [f"202310{day:02d}T105856" for day in range(1, 21)]
+        order = [5, 19, 0, 12, 3, 17, 1, 8, 14, 2, 10, 4, 16, 6, 11, 18, 7, 13, 9, 15]
+        for index, idx in enumerate(order):
+            self.assertEqual(self.append(dates[idx], self.scene + idx), index)
+
+        cube = self.cube()
+        self.assertEqual(list(cube.attrs['dates']), [dates[idx] for idx in order])
+        times = self.times()
+        np.testing.assert_array_equal(times, [date_seconds(dates[idx]) for idx in order])
+        for index, idx in enumerate(np.argsort(times)):
+            np.testing.assert_array_equal(cube[idx], self.scene + index)
+
+    def test_interrupted_append(self):
+        # an append interrupted before its date is registered is overwritten by the next one
+        self.append('20231017T105859', self.scene)
+        zarr.open_array(os.path.join(self.path, VARIABLE), mode='r+').resize((2, 40, 30))
+
+        self.assertEqual(self.append('20231012T105856', self.scene + 1), 1)
+        self.assertEqual(self.cube().shape[0], 2)
+        np.testing.assert_array_equal(self.times(), [date_seconds('20231017T105859'), date_seconds('20231012T105856')])
+
+    def test_dimension_names(self):
+        # dimension names read by xarray.open_zarr: in the metadata with zarr 3, in an attribute with zarr 2
+        self.append('20231012T105856', self.scene)
+
+        for array, dimensions in [(self.cube(), ('time', 'y', 'x')), (zarr.open_array(os.path.join(self.path, TIME), mode='r'), ('time',))]:
+            if ZARR_V3:
+                self.assertEqual(tuple(array.metadata.dimension_names), dimensions)
+            else:
+                self.assertEqual(tuple(array.attrs['_ARRAY_DIMENSIONS']), dimensions)
+
+    def test_append_existing_date(self):
+        self.append('20231012T105856', self.scene)
+        self.assertIsNone(self.append('20231012T105856', self.scene))
+        self.assertEqual(self.cube().shape[0], 1)
+
+    def test_append_other_grid(self):
+        self.append('20231012T105856', self.scene)
+        with self.assertRaises(ValueError):
+            self.append('20231017T105859', self.scene, geotransform=(400000, 10, 0, 4800000, 0, -10))
+
+    def test_concurrent_appends(self):
+        dates = [f"202310{day:02d}T105856" for day in range(1, 9)]
+        threads = [threading.Thread(target=self.append, args=(date, self.scene + idx)) for idx, date in enumerate(dates)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        cube = self.cube()
+        self.assertEqual(sorted(cube.attrs['dates']), dates)
+        np.testing.assert_array_equal(self.times(), [date_seconds(date) for date in cube.attrs['dates']])
+        for index, date in enumerate(cube.attrs['dates']):
+            np.testing.assert_array_equal(cube[index], self.scene + dates.index(date))
+
+    def test_lock_timeout(self):
+        with datacube_lock(self.path):
+            with self.assertRaises(TimeoutError):
+                with datacube_lock(self.path, timeout=0.2):
+                    pass
+
+
+if __name__ == '__main__':
+    unittest.main()
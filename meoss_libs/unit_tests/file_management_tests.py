@@ -3,7 +3,7 @@ import os
 import unittest
 
 
-from meoss_libs.file_management import list_files, generate_output_file_name
+from meoss_libs.file_management import list_files, generate_output_file_name, parse_output_file_name, group_by_date, generate_mosaic_file_name, group_by_tile, generate_change_file_name
 
 # avoid non pertinent log messages
 logger = logging.getLogger('FILE MANAGEMENT')
@@ -104,5 +104,63 @@ class TestGenerateOutputFileName(unittest.TestCase):
         pass
 
 
+class TestParseOutputFileName(unittest.TestCase):
+    """
+    test the parse_output_file_name function
+    """
+
+    def test_parse_generated_name(self):
+        # Test with a name generated from a S2-2A file
+        output_file = generate_output_file_name('SENTINEL2A_20231012-105856-398_L2A_T31TCJ_C_V3-1_FRE_B4.tif', format="S2-2A", prefix='NDVI', prefix2='prefix2', suffix='suffix')
+        self.assertEqual(parse_output_file_name(output_file), {'prefix': 'NDVI_prefix2', 'tile': 'T31TCJ', 'date': '20231012', 'time': '105856', 'suffix': 'suffix'})
+
+    def test_parse_name_with_path(self):
+        # Test with a path and without prefix nor suffix
+        self.assertEqual(parse_output_file_name('/var/res/T31TCJ_20231012T105856.tif'), {'prefix': '', 'tile': 'T31TCJ', 'date': '20231012', 'time': '105856', 'suffix': ''})
+
+    def test_parse_unknown_name(self):
+        # Test with a name not generated with the S2-2A or S2-3A format
+        self.assertIsNone(parse_output_file_name('SENTINEL2A_20231012-105856-398_L2A_T31TCJ_C_V3-1_ATB_R1.no_format.tif'))
+
+
+class TestGroupByDate(unittest.TestCase):
+    """
+    test the group_by_date and generate_mosaic_file_name functions
+    """
+
+    def test_group_by_date(self):
+        files = ['/res/NDVI_T31TDJ_20231012T105856.tif', '/res/NDVI_T31TCJ_20231012T105901.tif',
+                 '/res/NDVI_T31TCJ_20231017T105859.tif', '/res/test_file.tif']
+
+        self.assertEqual(group_by_date(files), {('NDVI', '20231012', ''): ['/res/NDVI_T31TCJ_20231012T105901.tif', '/res/NDVI_T31TDJ_20231012T105856.tif'],
+                                                ('NDVI', '20231017', ''): ['/res/NDVI_T31TCJ_20231017T105859.tif']})
+
+    def test_generate_mosaic_file_name(self):
+        self.assertEqual(generate_mosaic_file_name('NDVI', '20231012'), 'NDVI_MOSAIC_20231012.tif')
+        self.assertEqual(generate_mosaic_file_name('NDVI', '20231012', 'suffix'), 'NDVI_MOSAIC_20231012_suffix.tif')
+
+
+class TestGroupByTile(unittest.TestCase):
+    """
+    test the group_by_tile and generate_change_file_name functions
+    """
+
+    def test_group_by_tile(self):
+        files = ['/res/NDVI_T31TCJ_20231017T105859.tif', '/res/NDVI_T31TDJ_20231012T105856.tif',
+                 '/res/NDVI_T31TCJ_20231012T105901.tif', '/res/test_file.tif']
+
+        self.assertEqual(group_by_tile(files), {('NDVI', 'T31TCJ', ''): [('20231012', '/res/NDVI_T31TCJ_20231012T105901.tif'), ('20231017', '/res/NDVI_T31TCJ_20231017T105859.tif')],
+                                                ('NDVI', 'T31TDJ', ''): [('20231012', '/res/NDVI_T31TDJ_20231012T105856.tif')]})
+
+    def test_group_by_tile_with_names(self):
+        scenes = [('b4_2.tif', 'b8_2.tif'), ('b4_1.tif', 'b8_1.tif')]
+        names = ['NDVI_T31TCJ_20231017T105859.tif', 'NDVI_T31TCJ_20231012T105901.tif']
+
+        self.assertEqual(group_by_tile(scenes, names), {('NDVI', 'T31TCJ', ''): [('20231012', ('b4_1.tif', 'b8_1.tif')), ('20231017', ('b4_2.tif', 'b8_2.tif'))]})
+
+    def test_generate_change_file_name(self):
+        self.assertEqual(generate_change_file_name('CHANGE_NDVI', 'T31TCJ', '20231012', '20231017'), 'CHANGE_NDVI_T31TCJ_20231012_20231017.tif')
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
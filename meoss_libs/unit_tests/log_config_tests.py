@@ -0,0 +1,81 @@
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+
+from meoss_libs.log_config import setup_logging, setup_worker_logging, shutdown_logging, log_context
+
+logger = logging.getLogger('LOG CONFIG TESTS')
+
+
+def log_in_worker(queue):
+    setup_worker_logging(queue, 'INFO')
+    with log_context(scene='worker'):
+        logger.info("message from %s", 'worker')
+
+
+class TestLogConfig(unittest.TestCase):
+    """
+    Test the setup_logging, setup_worker_logging and log_context functions
+    """
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.log_file = os.path.join(self.test_dir, 'ndvi.log')
+
+    def tearDown(self):
+        shutdown_logging()
+        logging.getLogger().setLevel(logging.WARNING)
+        shutil.rmtree(self.test_dir)
+
+    def read_json(self):
+        with open(self.log_file) as log:
+            return [json.loads(line) for line in log]
+
+    def test_json_context(self):
+        setup_logging('INFO', 'json', self.log_file)
+        with log_context(scene='S2B_T31TCJ', tile='T31TCJ'):
+            with log_context(date='20231012'):
+                logger.info("NDVI of %d scene", 1)
+            logger.debug("not emitted")
+        logger.info("outside")
+        shutdown_logging()
+
+        records = self.read_json()
+        self.assertEqual(len(records), 2)
+        self.assertEqual(records[0]['message'], "NDVI of 1 scene")
+        self.assertEqual((records[0]['scene'], records[0]['tile'], records[0]['date']), ('S2B_T31TCJ', 'T31TCJ', '20231012'))
+        self.assertNotIn('scene', records[1])
+
+    def test_text_context(self):
+        setup_logging('INFO', 'text', self.log_file)
+        with log_context(tile='T31TCJ'):
+            logger.warning("cloudy")
+        shutdown_logging()
+
+        with open(self.log_file) as log:
+            self.assertRegex(log.read().strip(), r"\(WARNING\) LOG CONFIG TESTS\(l\d+\): cloudy \[tile=T31TCJ\]$")
+
+    def test_worker_process_through_queue(self):
+        queue = setup_logging('INFO', 'json', self.log_file, use_queue=True)
+        process = multiprocessing.get_context('fork').Process(target=log_in_worker, args=(queue,))
+        process.start()
+        process.join()
+        logger.info("message from main")
+        shutdown_logging()
+
+        records = {record['message']: record for record in self.read_json()}
+        self.assertEqual(records['message from worker']['scene'], 'worker')
+        self.assertEqual(records['message from worker']['process'], process.pid)
+        self.assertIn('message from main', records)
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            setup_logging('INFO', 'xml')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from osgeo import gdal
+
+from meoss_libs.mosaic import resolve_overlap, mosaic_ndvi
+from meoss_libs.numpy_backend import ndvi_block
+from meoss_libs.quantization import get_output_dtype, INPUT_NODATA
+from meoss_libs.unit_tests.synthetic_images import create_image, create_ndvi
+
+# avoid non pertinent log messages
+logger = logging.getLogger('MOSAIC')
+logger.disabled = True
+
+
+class TestResolveOverlap(unittest.TestCase):
+    """
+    Test the resolve_overlap function
+    """
+
+    def setUp(self):
+        self.stack = np.array([[[0, 500], [300, 0]],
+                               [[700, 200], [0, 0]]], dtype=np.int16)
+
+    def test_max(self):
+        np.testing.assert_array_equal(resolve_overlap(self.stack, 0, 'max'), [[700, 500], [300, 0]])
+
+    def test_first(self):
+        np.testing.assert_array_equal(resolve_overlap(self.stack, 0, 'first'), [[700, 500], [300, 0]])
+        np.testing.assert_array_equal(resolve_overlap(self.stack[::-1], 0, 'first'), [[700, 200], [300, 0]])
+
+    def test_unknown_overlap(self):
+        with self.assertRaises(ValueError):
+            resolve_overlap(self.stack, 0, 'mean')
+
+
+class TestMosaicNdvi(unittest.TestCase):
+    """
+    Test the mosaic_ndvi function on two overlapping synthetic tiles
+    """
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.west = np.full((40, 60), 100, dtype=np.int16)
+        self.east = np.full((40, 60), 200, dtype=np.int16)
+
+        self.west_file = os.path.join(self.test_dir, 'NDVI_T31TCJ_20231012T105856.tif')
+        self.east_file = os.path.join(self.test_dir, 'NDVI_T31TDJ_20231012T105856.tif')
+        create_image(self.west_file, self.west, gdal_dtype=gdal.GDT_Int16)
+        create_image(self.east_file, self.east, gdal_dtype=gdal.GDT_Int16)
+
+        # the east tile starts 40 columns (400 m) east of the west tile
+        data_set = gdal.Open(self.east_file, gdal.GA_Update)
+        data_set.SetGeoTransform([300400, 10, 0, 4800000, 0, -10])
+        data_set = None
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_mosaic_max(self):
+        output_file = os.path.join(self.test_dir, 'mosaic.tif')
+        mosaic_ndvi([self.west_file, self.east_file], output_file, overlap='max', block_size=7, threads=2)
+
+        output = gdal.Open(output_file).ReadAsArray()
+        self.assertEqual(output.shape, (40, 100))
+        np.testing.assert_array_equal(output[:, :40], 100)
+        np.testing.assert_array_equal(output[:, 40:], 200)
+
+    def test_mosaic_first(self):
+        output_file = os.path.join(self.test_dir, 'mosaic.tif')
+        mosaic_ndvi([self.west_file, self.east_file], output_file, overlap='first', block_size=7, threads=2)
+
+        output = gdal.Open(output_file).ReadAsArray()
+        np.testing.assert_array_equal(output[:, :60], 100)
+        np.testing.assert_array_equal(output[:, 60:], 200)
+
+    def test_mosaic_input_nodata_overlap(self):
+        # the overlap of the west tile is not observed (MAJA reflectances at -10000): its NDVI is nodata and the east
+        # tile is used, whatever the overlap rule
+        mask = np.zeros((40, 60), dtype=np.uint8)
+        red = np.full((40, 60), 1000, dtype=np.int16)
+        west_nir = np.full((40, 60), 3000, dtype=np.int16)
+        west_nir[:, 40:] = INPUT_NODATA
+        west = ndvi_block(west_nir, red, mask, 0)
+        east = ndvi_block(np.full((40, 60), 2000, dtype=np.int16), red, mask, 0)
+
+        create_ndvi(self.west_file, west)
+        create_ndvi(self.east_file, east)
+        data_set = gdal.Open(self.east_file, gdal.GA_Update)
+        data_set.SetGeoTransform([300400, 10, 0, 4800000, 0, -10])
+        data_set = None
+
+        for overlap in ['max', 'first']:
+            output_file = os.path.join(self.test_dir, f'mosaic_{overlap}.tif')
+            mosaic_ndvi([self.west_file, self.east_file], output_file, overlap=overlap, block_size=7, threads=2)
+
+            output = gdal.Open(output_file)
+            self.assertEqual(output.GetRasterBand(1).GetNoDataValue(), get_output_dtype('int16')['nodata'])
+            output = output.ReadAsArray()
+            np.testing.assert_array_equal(output[:, :40], west[:, :40])
+            np.testing.assert_array_equal(output[:, 40:], east[:, 0:1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+from osgeo import gdal
+
+from meoss_libs.cloud_mask import dilate
+from meoss_libs.numpy_backend import ndvi_block, block_windows, ndvi_band_numpy
+from meoss_libs.quantization import get_output_dtype
+from meoss_libs.unit_tests.synthetic_images import create_image
+
+# avoid non pertinent log messages
+logger = logging.getLogger('NUMPY BACKEND')
+logger.disabled = True
+
+# nodata of the int16 default output
+NODATA = get_output_dtype('int16')['nodata']
+
+
+class TestNdviBlock(unittest.TestCase):
+    """
+    Test the ndvi_block function
+    """
+
+    def test_ndvi_values(self):
+        nir = np.array([[3000, 1000], [0, 500]], dtype=np.uint16)
+        red = np.array([[1000, 3000], [0, 500]], dtype=np.uint16)
+        mask = np.zeros((2, 2), dtype=np.uint8)
+
+        ndvi = ndvi_block(nir, red, mask, 0)
+        self.assertEqual(ndvi.dtype, np.int16)
+        np.testing.assert_array_equal(ndvi, [[500, -500], [0, 0]])
+
+    def test_cloud_mask(self):
+        nir = np.full((2, 2), 3000, dtype=np.uint16)
+        red = np.full((2, 2), 1000, dtype=np.uint16)
+        mask = np.array([[4, 1], [0, 4]], dtype=np.uint8)
+
+        ndvi = ndvi_block(nir, red, mask, 4)
+        np.testing.assert_array_equal(ndvi, [[500, NODATA], [NODATA, 500]])
+
+    def test_uint8_quantization(self):
+        nir = np.array([[3000, 1000], [0, 500]], dtype=np.uint16)
+        red = np.array([[1000, 3000], [0, 500]], dtype=np.uint16)
+        mask = np.array([[0, 0], [0, 1]], dtype=np.uint8)
+
+        # ndvi 0.5 -> 187.5 truncated to 187, -0.5 -> 62, 0 -> 125, masked -> 255 (nodata)
+        ndvi = ndvi_block(nir, red, mask, 0, out_dtype='uint8')
+        self.assertEqual(ndvi.dtype, np.uint8)
+        np.testing.assert_array_equal(ndvi, [[187, 62], [125, 255]])
+
+    def test_float32_quantization(self):
+        nir = np.array([[3000]], dtype=np.uint16)
+        red = np.array([[1000]], dtype=np.uint16)
+
+        ndvi = ndvi_block(nir, red, np.array([[0]]), 0, out_dtype='float32')
+        self.assertEqual(ndvi.dtype, np.float32)
+        np.testing.assert_allclose(ndvi, [[0.5]], rtol=1e-6)
+
+    def test_input_nodata(self):
+        # MAJA reflectances are -10000 where not observed, whatever the cloud mask
+        nir = np.array([[3000, -10000, 3000, -10000]], dtype=np.int16)
+        red = np.array([[1000, 1000, -10000, -10000]], dtype=np.int16)
+
+        for out_dtype in ['int16', 'uint8', 'float32']:
+            spec = get_output_dtype(out_dtype)
+            ndvi = ndvi_block(nir, red, np.zeros((1, 4)), 0, out_dtype)
+            np.testing.assert_array_equal(ndvi[0, 1:], [spec['nodata']] * 3)
+            self.assertNotEqual(ndvi[0, 0], spec['nodata'])
+
+    def test_numexpr_matches_numpy(self):
+        # the numexpr and numpy paths both compute in double, as OTB does
+        rng = np.random.default_rng(0)
+        nir = rng.integers(0, 10000, (64, 64), dtype=np.uint16)
+        red = rng.integers(0, 10000, (64, 64), dtype=np.uint16)
+        mask = np.zeros((64, 64), dtype=np.uint8)
+
+        with mock.patch('meoss_libs.numpy_backend.numexpr', None):
+            expected = {out_dtype: ndvi_block(nir, red, mask, 0, out_dtype) for out_dtype in ['int16', 'uint8', 'float32']}
+        for out_dtype, ndvi in expected.items():
+            np.testing.assert_array_equal(ndvi_block(nir, red, mask, 0, out_dtype), ndvi)
+
+
+class TestBlockWindows(unittest.TestCase):
+    """
+    Test the block_windows function
+    """
+
+    def test_windows_cover_image(self):
+        windows = block_windows(5, 10, 100, 25, 10)
+        self.assertEqual(windows, [(5, 10, 100, 10), (5, 20, 100, 10), (5, 30, 100, 5)])
+
+
+class TestNdviBandNumpy(unittest.TestCase):
+    """
+    Test the ndvi_band_numpy function on synthetic images
+    """
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        rng = np.random.default_rng(0)
+
+        self.nir = rng.integers(0, 10000, (100, 120), dtype=np.uint16)
+        self.red = rng.integers(0, 10000, (100, 120), dtype=np.uint16)
+        self.mask = rng.integers(0, 2, (50, 60), dtype=np.uint8)
+
+        self.nir_file = os.path.join(self.test_dir, 'nir.tif')
+        self.red_file = os.path.join(self.test_dir, 'red.tif')
+        self.mask_file = os.path.join(self.test_dir, 'mask.tif')
+        create_image(self.nir_file, self.nir)
+        create_image(self.red_file, self.red)
+        create_image(self.mask_file, self.mask, pixel_size=20, gdal_dtype=gdal.GDT_Byte)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_ndvi_band_numpy(self):
+        output_file = os.path.join(self.test_dir, 'ndvi.tif')
+        ndvi_band_numpy(self.nir_file, self.red_file, self.mask_file, output_file, block_size=16, threads=3)
+
+        # reference: 20 m mask superimposed on the 10 m grid with nearest neighbour
+        mask = np.repeat(np.repeat(self.mask, 2, axis=0), 2, axis=1)
+        nir, red = self.nir.astype(np.float64), self.red.astype(np.float64)
+        reference = np.trunc(np.where(mask == 0, (nir - red) / (nir + red + 1.E-6) * 1000, NODATA))
+
+        output = gdal.Open(output_file)
+        self.assertEqual(output.GetRasterBand(1).DataType, gdal.GDT_Int16)
+        self.assertEqual(output.GetRasterBand(1).GetScale(), 0.001)
+        self.assertEqual(output.GetRasterBand(1).GetNoDataValue(), NODATA)
+        np.testing.assert_allclose(output.ReadAsArray(), reference, atol=1)
+
+    def test_ndvi_band_numpy_interrupted(self):
+        # a failure while writing leaves no output (which would be skipped as already existing) nor temporary file
+        output_file = os.path.join(self.test_dir, 'ndvi.tif')
+        with mock.patch('meoss_libs.numpy_backend.ndvi_block', side_effect=MemoryError):
+            with self.assertRaises(MemoryError):
+                ndvi_band_numpy(self.nir_file, self.red_file, self.mask_file, output_file, block_size=16, threads=3)
+
+        self.assertEqual(sorted(os.listdir(self.test_dir)), ['mask.tif', 'nir.tif', 'red.tif'])
+
+    def test_ndvi_band_numpy_mask_dilation(self):
+        # blocks of 16 lines and a halo of 3 pixels must give the same result as the dilation of the whole mask
+        output_file = os.path.join(self.test_dir, 'ndvi.tif')
+        ndvi_band_numpy(self.nir_file, self.red_file, self.mask_file, output_file, block_size=16, threads=3, mask_dilation=3)
+
+        cloudy = dilate(np.repeat(np.repeat(self.mask, 2, axis=0), 2, axis=1) != 0, 3)
+        nir, red = self.nir.astype(np.float64), self.red.astype(np.float64)
+        reference = np.trunc(np.where(~cloudy, (nir - red) / (nir + red + 1.E-6) * 1000, NODATA))
+
+        output = gdal.Open(output_file).ReadAsArray()
+        np.testing.assert_array_equal(output[cloudy], NODATA)
+        np.testing.assert_allclose(output, reference, atol=1)
+
+
+if __name__ == '__main__':
+    unittest.main()
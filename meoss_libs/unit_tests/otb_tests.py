@@ -0,0 +1,139 @@
+import sys
+import unittest
+from unittest import mock
+
+from meoss_libs.otb import OtbApplicationPool, reset_application, bandmath_otb, concatenate_images_otb, radiometric_indices_otb
+
+
+class FakeApplication:
+    """
+    minimal stand-in of an otbApplication object, records the parameters set, the executions and the resets
+    """
+
+    def __init__(self):
+        self.parameters = {'in': None, 'out': None, 'ram': None}
+        self.freed = 0
+        self.executed = 0
+
+    def SetParameterString(self, key, value):
+        self.parameters[key] = value
+
+    SetParameterInt = SetParameterString
+    SetParameterInputImage = SetParameterString
+
+    def SetParameterStringList(self, key, values):
+        self.parameters[key] = list(values)
+
+    def AddParameterStringList(self, key, value):
+        # as in otb, the images are appended to the list already set
+        self.parameters[key] = (self.parameters.get(key) or []) + [value]
+
+    AddImageToParameterInputImageList = AddParameterStringList
+
+    def Execute(self):
+        self.executed += 1
+
+    ExecuteAndWriteOutput = Execute
+
+    def GetParametersKeys(self):
+        return list(self.parameters)
+
+    def HasUserValue(self, key):
+        return self.parameters[key] is not None
+
+    def ClearValue(self, key):
+        self.parameters[key] = None
+
+    def FreeRessources(self):
+        self.freed += 1
+
+
+class TestOtbApplicationPool(unittest.TestCase):
+    """
+    Test the OtbApplicationPool class
+    """
+
+    def setUp(self):
+        self.pool = OtbApplicationPool()
+        self.app = FakeApplication()
+        self.pool.applications[('ndvi', 'RadiometricIndices')] = self.app
+
+    def test_reset_application(self):
+        self.app.SetParameterString('in', 'image.tif')
+        self.app.SetParameterString('out', 'ndvi.tif')
+
+        reset_application(self.app)
+        self.assertEqual(self.app.parameters, {'in': None, 'out': None, 'ram': None})
+        self.assertEqual(self.app.freed, 1)
+
+    def test_get_reuses_and_resets_application(self):
+        self.app.SetParameterString('in', 'image.tif')
+
+        app = self.pool.get('ndvi', 'RadiometricIndices')
+        self.assertIs(app, self.app)
+        self.assertIsNone(app.parameters['in'])
+
+    def test_get_same_key_other_application(self):
+        registry = mock.Mock()
+        registry.Registry.CreateApplication.side_effect = lambda name: FakeApplication()
+
+        with mock.patch.dict(sys.modules, {'otbApplication': registry}):
+            app = self.pool.get('ndvi', 'BandMath')
+
+        registry.Registry.CreateApplication.assert_called_once_with('BandMath')
+        self.assertIsNot(app, self.app)
+        self.assertIs(self.pool.get('ndvi', 'RadiometricIndices'), self.app)
+        self.assertIs(self.pool.get('ndvi', 'BandMath'), app)
+
+    def test_clear(self):
+        self.pool.clear()
+        self.assertEqual(self.pool.applications, {})
+        self.assertEqual(self.app.freed, 1)
+
+
+class TestOtbWrappers(unittest.TestCase):
+    """
+    Test the otb wrappers run twice with the application of an OtbApplicationPool
+    """
+
+    def setUp(self):
+        self.pool = OtbApplicationPool()
+        self.registry = mock.Mock()
+        self.registry.Registry.CreateApplication.side_effect = lambda name: FakeApplication()
+        patcher = mock.patch.dict(sys.modules, {'otbApplication': self.registry})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_bandmath_otb_pooled(self):
+        first = bandmath_otb(il=['nir1.tif', 'red1.tif'], exp='im1b1', app=self.pool.get('ndvi', 'BandMath'))
+        second = bandmath_otb(il=['nir2.tif'], il_object=['mask2'], exp='im1b1+im2b1', app=self.pool.get('ndvi', 'BandMath'))
+
+        self.registry.Registry.CreateApplication.assert_called_once_with('BandMath')
+        self.assertIs(first, second)
+        self.assertEqual(second.parameters['il'], ['nir2.tif', 'mask2'])
+        self.assertEqual(second.parameters['exp'], 'im1b1+im2b1')
+        self.assertEqual(second.executed, 2)
+
+    def test_concatenate_images_otb_pooled(self):
+        first = concatenate_images_otb(il=['b4.tif', 'b8.tif'], app=self.pool.get('concat', 'ConcatenateImages'))
+        second = concatenate_images_otb(il=['b4_2.tif', 'b8_2.tif'], app=self.pool.get('concat', 'ConcatenateImages'))
+
+        self.registry.Registry.CreateApplication.assert_called_once_with('ConcatenateImages')
+        self.assertIs(first, second)
+        self.assertEqual(second.parameters['il'], ['b4_2.tif', 'b8_2.tif'])
+
+    def test_radiometric_indices_otb_pooled(self):
+        first = radiometric_indices_otb('image1.tif', 'ndvi1.tif', 4, 3, app=self.pool.get('ndvi', 'RadiometricIndices'))
+        stack = concatenate_images_otb(il=['b4.tif', 'b8.tif'], app=self.pool.get('ndvi', 'ConcatenateImages'))
+        second = radiometric_indices_otb(stack, 'ndvi2.tif', 2, 1, action='exe', app=self.pool.get('ndvi', 'RadiometricIndices'))
+
+        self.assertEqual(self.registry.Registry.CreateApplication.call_count, 2)
+        self.assertIs(first, second)
+        self.assertIs(second.parameters['in'], stack)
+        self.assertEqual((second.parameters['out'], second.parameters['channels.nir'], second.parameters['channels.red']),
+                         ('ndvi2.tif', 2, 1))
+        self.assertEqual(second.executed, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import logging
+import unittest
+
+import numpy as np
+
+from meoss_libs.file_management import group_by_date, parse_output_file_name
+from meoss_libs.preview import PreviewAccumulator, ndvi_colors, preview_file_names
+
+# avoid non pertinent log messages
+logger = logging.getLogger('PREVIEW')
+logger.disabled = True
+
+
+class TestPreviewAccumulator(unittest.TestCase):
+    """
+    Test the PreviewAccumulator class
+    """
+
+    def setUp(self):
+        self.image = np.arange(13 * 17, dtype=np.int16).reshape(13, 17)
+        self.image[0, 0] = 0
+
+    def reference_average(self, factor, nodata):
+        reference = np.zeros((-(-13 // factor), -(-17 // factor)))
+        for row in range(reference.shape[0]):
+            for col in range(reference.shape[1]):
+                cell = self.image[row * factor:(row + 1) * factor, col * factor:(col + 1) * factor].astype(float)
+                reference[row, col] = np.rint(cell[cell != nodata].mean())
+        return reference
+
+    def test_average_with_blocks_not_aligned_on_cells(self):
+        # blocks of 5 lines, cells of 3 x 3 pixels: some cells are completed by two blocks
+        accumulator = PreviewAccumulator(17, 13, factor=3, nodata=0)
+        for yoff in range(0, 13, 5):
+            accumulator.add(self.image[yoff:yoff + 5], 0, yoff)
+
+        preview = accumulator.result()
+        self.assertEqual(preview.dtype, np.int16)
+        np.testing.assert_array_equal(preview, self.reference_average(3, 0))
+
+    def test_decimate(self):
+        accumulator = PreviewAccumulator(17, 13, factor=3, nodata=-1, method='decimate')
+        for yoff in range(0, 13, 4):
+            accumulator.add(self.image[yoff:yoff + 4], 0, yoff)
+
+        np.testing.assert_array_equal(accumulator.result(), self.image[::3, ::3])
+
+    def test_cells_without_valid_pixels(self):
+        accumulator = PreviewAccumulator(4, 2, factor=2, nodata=255)
+        accumulator.add(np.array([[255, 255, 10, 20], [255, 255, 30, 255]], dtype=np.uint8), 0, 0)
+
+        np.testing.assert_array_equal(accumulator.result(), [[255, 20]])
+
+    def test_integer_blocks_need_nodata(self):
+        accumulator = PreviewAccumulator(17, 13, factor=3)
+        with self.assertRaises(ValueError):
+            accumulator.add(self.image, 0, 0)
+
+    def test_non_finite_pixels(self):
+        accumulator = PreviewAccumulator(4, 2, factor=2, nodata=-9999.)
+        accumulator.add(np.array([[np.nan, np.inf, 0.2, -9999.], [-np.inf, np.nan, 0.4, 0.6]], dtype=np.float32), 0, 0)
+
+        np.testing.assert_array_equal(accumulator.result(), np.array([[-9999., 0.4]], dtype=np.float32))
+
+    def test_unknown_method(self):
+        with self.assertRaises(ValueError):
+            PreviewAccumulator(10, 10, method='median')
+
+
+class TestPreviewFiles(unittest.TestCase):
+    """
+    Test the preview_file_names and ndvi_colors functions
+    """
+
+    def test_preview_file_names(self):
+        self.assertEqual(preview_file_names('/res/NDVI_T31TCJ_20231012T105856.tif', 'jpeg'),
+                         ('/res/NDVI_T31TCJ_20231012T105856.preview.tif', '/res/NDVI_T31TCJ_20231012T105856.quicklook.jpeg'))
+
+    def test_preview_is_not_a_product(self):
+        for file in preview_file_names('/res/NDVI_T31TCJ_20231012T105856.tif'):
+            self.assertIsNone(parse_output_file_name(file))
+        self.assertEqual(group_by_date(list(preview_file_names('/res/NDVI_T31TCJ_20231012T105856.tif'))), {})
+
+    def test_ndvi_colors(self):
+        rgba = ndvi_colors(np.array([[-1., 1., np.nan]]))
+        np.testing.assert_array_equal(rgba[:, 0, 0], [165, 0, 38, 255])
+        np.testing.assert_array_equal(rgba[:, 0, 1], [0, 104, 55, 255])
+        self.assertEqual(rgba[3, 0, 2], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
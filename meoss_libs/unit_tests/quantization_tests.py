@@ -0,0 +1,41 @@
+import unittest
+
+from meoss_libs.quantization import get_output_dtype, quantization_coefficients, bandmath_quantization_expression
+
+
+class TestQuantization(unittest.TestCase):
+    """
+    Test the output data types specifications and the fused quantization expressions
+    """
+
+    def test_unknown_dtype(self):
+        with self.assertRaises(ValueError):
+            get_output_dtype('int8')
+
+    def test_coefficients_match_scale_and_offset(self):
+        # value = ndvi * gain + bias must give back ndvi = value * scale + offset
+        for out_dtype in ['int16', 'uint8', 'float32']:
+            spec = get_output_dtype(out_dtype)
+            gain, bias = quantization_coefficients(out_dtype)
+            for ndvi in [-1, -0.5, 0, 0.5, 1]:
+                self.assertAlmostEqual((ndvi * gain + bias) * spec['scale'] + spec['offset'], ndvi)
+
+    def test_nodata_outside_valid_range(self):
+        for out_dtype in ['int16', 'uint8']:
+            spec = get_output_dtype(out_dtype)
+            self.assertFalse(spec['min'] <= spec['nodata'] <= spec['max'], out_dtype)
+
+    def test_int16_expression(self):
+        # band mode historical expression (NDVI x 1000), clipped to the valid range
+        self.assertEqual(bandmath_quantization_expression('(im1b1-im2b1)/(im1b1+im2b1+1.E-6)', 'int16'),
+                         'min(max((im1b1-im2b1)/(im1b1+im2b1+1.E-6)*1000.0,-1000),1000)')
+
+    def test_uint8_expression(self):
+        self.assertEqual(bandmath_quantization_expression('im1b1', 'uint8'), 'min(max(im1b1*125.0+125.0,0),250)')
+
+    def test_float32_expression(self):
+        self.assertEqual(bandmath_quantization_expression('im1b1', 'float32'), 'im1b1')
+
+
+if __name__ == '__main__':
+    unittest.main()
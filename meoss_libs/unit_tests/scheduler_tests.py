@@ -0,0 +1,186 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+from concurrent.futures.process import BrokenProcessPool
+from unittest import mock
+
+from meoss_libs.scheduler import CostHistory, ScheduledScene, reset_peak_rss, run_scene, run_scheduled, HISTORY_WEIGHT, DEFAULT_PIXELS, SCENE_SKIPPED, SCENE_FAILED
+
+
+def sleeping_scene(name, duration, output_dir):
+    """
+    scene of the tests: sleep and record its start and end times
+    """
+    start = time.time()
+    time.sleep(duration)
+    with open(os.path.join(output_dir, f"{name}.json"), 'w') as record:
+        json.dump({'start': start, 'end': time.time()}, record)
+    return name
+
+
+def allocating_scene(size):
+    """
+    scene of the tests which allocates (and writes) size bytes
+    """
+    data = b'\x01' * size
+    return len(data)
+
+
+def crashing_scene():
+    """
+    scene of the tests whose worker process dies (as when killed by the system out of memory)
+    """
+    os._exit(1)
+
+
+def status_scene(status):
+    """
+    scene of the tests which is not computed (output already there, or error), it returns its status at once
+    """
+    return status
+
+
+class TestScheduler(unittest.TestCase):
+    """
+    Test the CostHistory class and the run_scheduled function
+    """
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.history_file = os.path.join(self.test_dir, 'history.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def intervals(self, names):
+        intervals = {}
+        for name in names:
+            with open(os.path.join(self.test_dir, f"{name}.json")) as record:
+                times = json.load(record)
+            intervals[name] = (times['start'], times['end'])
+        return intervals
+
+    def test_cost_history(self):
+        history = CostHistory(self.history_file)
+        default_seconds, default_memory = history.estimate('S2-2A', 1000000)
+        self.assertGreater(default_seconds, 0)
+        self.assertGreater(default_memory, 0)
+
+        # the first measure of a format replaces the default costs, the next ones are averaged
+        history.update('S2-2A', 1000000, 10., 4000000)
+        self.assertEqual(history.estimate('S2-2A', 2000000), (20., 8000000))
+        history.update('S2-2A', 1000000, 20.)
+        self.assertAlmostEqual(history.estimate('S2-2A', 1000000)[0], (1 - HISTORY_WEIGHT) * 10. + HISTORY_WEIGHT * 20.)
+        self.assertEqual(history.estimate('S2-2A', 1000000)[1], 4000000)
+
+        history.save()
+        self.assertEqual(CostHistory(self.history_file).costs, history.costs)
+        self.assertEqual(CostHistory(self.history_file).estimate('S2-3A', 1000000), history.estimate('S2-3A', 1000000))
+
+    def test_cost_history_per_backend(self):
+        # the measures of a backend do not change the estimates of the other backends of the format
+        history = CostHistory(self.history_file)
+        default = history.estimate('S2-2A', 1000000, 'otb')
+        history.update('S2-2A', 1000000, 10., 4000000, 'numpy')
+
+        self.assertEqual(history.estimate('S2-2A', 1000000, 'numpy'), (10., 4000000))
+        self.assertEqual(history.estimate('S2-2A', 1000000, 'otb'), default)
+        history.save()
+        self.assertEqual(list(CostHistory(self.history_file).costs), ['S2-2A/numpy'])
+
+    def test_unknown_scene_size(self):
+        history = CostHistory()
+        self.assertEqual(history.estimate('S2-2A', None), history.estimate('S2-2A', DEFAULT_PIXELS))
+
+        history.update('S2-2A', None, 10.)
+        self.assertNotIn('S2-2A', history.costs)
+
+    def test_cost_history_unreadable(self):
+        with open(self.history_file, 'w') as history_file:
+            history_file.write('not json')
+
+        with self.assertLogs('SCHEDULER', 'WARNING'):
+            history = CostHistory(self.history_file)
+        self.assertEqual(history.costs, {})
+
+    def test_run_scheduled_largest_first(self):
+        scenes = [ScheduledScene(sleeping_scene, (name, 0.2, self.test_dir), 'S2-2A', pixels, name)
+                  for name, pixels in [('small', 1000), ('large', 3000), ('medium', 2000)]]
+
+        results = run_scheduled(scenes, 1, history=CostHistory(self.history_file))
+
+        self.assertEqual(results, ['large', 'medium', 'small'])
+        self.assertEqual(CostHistory(self.history_file).costs['S2-2A']['count'], 3)
+
+    def test_skipped_and_failed_scenes_not_measured(self):
+        scenes = [ScheduledScene(status_scene, (status,), 'S2-2A', 1000, status) for status in [SCENE_SKIPPED, SCENE_FAILED]]
+
+        results = run_scheduled(scenes, 2, history=CostHistory(self.history_file))
+
+        self.assertEqual(sorted(results), sorted([SCENE_SKIPPED, SCENE_FAILED]))
+        self.assertNotIn('S2-2A', CostHistory(self.history_file).costs)
+
+    def test_run_scheduled_broken_pool(self):
+        # scenes run largest first on one worker: the first one is measured, the worker dies on the second one
+        scenes = [ScheduledScene(sleeping_scene, ('done', 0., self.test_dir), 'S2-2A', 3000, 'done'),
+                  ScheduledScene(crashing_scene, (), 'S2-2A', 2000, 'crash'),
+                  ScheduledScene(sleeping_scene, ('lost', 0., self.test_dir), 'S2-2A', 1000, 'lost')]
+
+        with self.assertLogs('SCHEDULER', 'ERROR') as logs, self.assertRaises(BrokenProcessPool):
+            run_scheduled(scenes, 1, history=CostHistory(self.history_file))
+
+        self.assertIn('crash, lost', logs.output[-1])
+        self.assertEqual(CostHistory(self.history_file).costs['S2-2A']['count'], 1)
+
+    def test_run_scheduled_memory_budget(self):
+        history = CostHistory()
+        history.costs['S2-2A'] = {'seconds_per_mpixel': 1., 'bytes_per_pixel': 1.}
+
+        # the large scene does not fit in the budget with another scene: it runs alone, the two small ones together
+        scenes = [ScheduledScene(sleeping_scene, ('large', 0.5, self.test_dir), 'S2-2A', 6000, 'large'),
+                  ScheduledScene(sleeping_scene, ('small1', 0.5, self.test_dir), 'S2-2A', 2000, 'small1'),
+                  ScheduledScene(sleeping_scene, ('small2', 0.5, self.test_dir), 'S2-2A', 2000, 'small2')]
+
+        results = run_scheduled(scenes, 2, memory_budget=7000, history=history)
+
+        self.assertEqual(sorted(results), ['large', 'small1', 'small2'])
+        intervals = self.intervals(results)
+        self.assertLessEqual(intervals['large'][1], min(intervals['small1'][0], intervals['small2'][0]))
+        self.assertLess(max(intervals['small1'][0], intervals['small2'][0]), min(intervals['small1'][1], intervals['small2'][1]))
+
+    def test_run_scheduled_scene_over_budget(self):
+        scenes = [ScheduledScene(sleeping_scene, ('huge', 0., self.test_dir), 'S2-2A', 10 ** 6, 'huge')]
+
+        with self.assertLogs('SCHEDULER', 'WARNING'):
+            results = run_scheduled(scenes, 2, memory_budget=1)
+        self.assertEqual(results, ['huge'])
+
+    @unittest.skipUnless(reset_peak_rss(), "peak resident memory can not be reset on this system")
+    def test_run_scene_peak_memory(self):
+        # the peak is reset before each scene: the second scene of a worker is measured even if it does not exceed
+        # the peak of the first one
+        size = 50 * 1024 * 1024
+        for _ in range(2):
+            result, _, peak = run_scene(allocating_scene, (size,))
+            self.assertEqual(result, size)
+            self.assertIsNotNone(peak)
+            # memory already resident in the process (e.g. freed by the previous scene) can be reused
+            self.assertGreaterEqual(peak, 0.9 * size)
+
+    def test_run_scene_without_resource_module(self):
+        # the peak can not be reset and the resource module is Unix only: scenes are still run and timed, without
+        # peak memory
+        with mock.patch.dict(sys.modules, {'resource': None}), mock.patch('meoss_libs.scheduler.reset_peak_rss', return_value=False):
+            result, duration, peak = run_scene(sleeping_scene, ('no_resource', 0., self.test_dir))
+
+        self.assertEqual(result, 'no_resource')
+        self.assertGreaterEqual(duration, 0)
+        self.assertIsNone(peak)
+
+
+if __name__ == '__main__':
+    unittest.main()
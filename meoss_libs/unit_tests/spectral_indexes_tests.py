@@ -0,0 +1,186 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+import unittest
+
+import numpy as np
+from osgeo import gdal
+
+from meoss_libs.spectral_indexes import f_ndvi, f_ndvi_quantized, f_rescale, create_ndvi_image
+from meoss_libs.quantization import get_output_dtype
+from meoss_libs.unit_tests.synthetic_images import create_image
+
+# square synthetic rasters, side in pixels
+SIZES = [256, 1024, 2048]
+
+# regression thresholds: minimum throughput (megapixels per second, best of REPEAT runs) and maximum peak memory
+# allocated by numpy during a call. Throughputs are set well below the values measured on a laptop (they depend on
+# the machine). Memory peaks do not: they are checked as a ratio of the peaks of the implementation before the
+# optimizations (bytes per pixel), the maximum ratios are the measured ratios (f_ndvi 1, not optimized, f_rescale 0.2,
+# create_ndvi_image 0.66) plus a 25% margin.
+REPEAT = 3
+MIN_MPIXELS_PER_SECOND = {'f_ndvi': 20, 'f_rescale': 20, 'create_ndvi_image': 2}
+BASELINE_BYTES_PER_PIXEL = {'f_ndvi': 16, 'f_rescale': 40, 'create_ndvi_image': 95}
+MAX_MEMORY_RATIO = {'f_ndvi': 1.25, 'f_rescale': 0.25, 'create_ndvi_image': 0.83}
+
+# set this environment variable to a file path to record the measures (JSON)
+BENCHMARK_FILE = os.environ.get('SPECTRAL_INDEXES_BENCHMARK_FILE')
+
+
+def measure(function, *args, **kwargs):
+    """
+    Run function and return its result, its best execution time over REPEAT runs and the peak of memory allocated
+    during a run (tracemalloc, measured on a separate run as tracing slows down the execution).
+    """
+    durations = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        durations.append(time.perf_counter() - start)
+        del result
+
+    tracemalloc.start()
+    result = function(*args, **kwargs)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return result, min(durations), peak
+
+
+class TestSpectralIndexes(unittest.TestCase):
+    """
+    Test the results, throughput and memory of f_ndvi, f_rescale and create_ndvi_image on synthetic rasters
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.test_dir = tempfile.mkdtemp()
+        cls.measures = []
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.test_dir)
+        if BENCHMARK_FILE:
+            with open(BENCHMARK_FILE, 'w') as benchmark:
+                json.dump(cls.measures, benchmark, indent=2)
+
+    def check_performance(self, name, size, duration, peak):
+        mpixels_per_second = size * size / 1e6 / duration
+        bytes_per_pixel = peak / (size * size)
+        memory_ratio = bytes_per_pixel / BASELINE_BYTES_PER_PIXEL[name]
+        self.measures.append({'function': name, 'size': size, 'mpixels_per_second': round(mpixels_per_second, 1),
+                              'peak_bytes_per_pixel': round(bytes_per_pixel, 1), 'memory_ratio': round(memory_ratio, 2)})
+
+        # the throughput of small rasters is dominated by fixed costs, only memory is checked
+        if size >= 1024:
+            self.assertGreaterEqual(mpixels_per_second, MIN_MPIXELS_PER_SECOND[name], f"{name} {size}x{size}: throughput regression")
+        self.assertLessEqual(memory_ratio, MAX_MEMORY_RATIO[name], f"{name} {size}x{size}: memory regression "
+                             f"({bytes_per_pixel:.1f} bytes per pixel, {BASELINE_BYTES_PER_PIXEL[name]} before the optimizations)")
+
+    def bands(self, size):
+        rng = np.random.default_rng(size)
+        bands = rng.integers(1, 10000, (4, size, size), dtype=np.uint16)
+        bands[:, :2, :2] = 0
+        return bands
+
+    def test_f_ndvi(self):
+        for size in SIZES:
+            with self.subTest(size=size):
+                bands = self.bands(size)
+                red, nir = bands[2].astype(float), bands[3].astype(float)
+
+                ndvi, duration, peak = measure(f_ndvi, red[2:, 2:], nir[2:, 2:])
+                reference = np.array([(n - r) / (n + r) for r, n in zip(red[2:, 2:].ravel()[:1000], nir[2:, 2:].ravel()[:1000])])
+                np.testing.assert_array_equal(ndvi.ravel()[:1000], reference)
+                self.assertTrue(np.all((ndvi >= -1) & (ndvi <= 1)))
+
+                self.check_performance('f_ndvi', size, duration, peak)
+
+    def test_f_rescale(self):
+        for size in SIZES:
+            with self.subTest(size=size):
+                ndvi = np.random.default_rng(size).uniform(-1, 1, (size, size))
+
+                rescaled, duration, peak = measure(f_rescale, ndvi, (-1, 1), (0, 255))
+                self.assertEqual(rescaled.dtype, np.float64)
+                np.testing.assert_allclose(rescaled, (ndvi + 1) * 127.5, rtol=1e-12)
+
+                self.check_performance('f_rescale', size, duration, peak)
+
+    def test_f_rescale_masked_array(self):
+        ndvi = np.ma.masked_equal(np.array([[-1., 0.5], [-9999, 1.]]), -9999)
+
+        rescaled = f_rescale(ndvi, (-1, 1), (0, 250))
+        self.assertTrue(rescaled.mask[1, 0])
+        np.testing.assert_allclose(rescaled.compressed(), [0, 187.5, 250])
+
+    def test_f_ndvi_quantized(self):
+        # computed in float64 as f_ndvi: the quantized values are exactly the truncated f_ndvi values
+        bands = self.bands(256)
+        red, nir = bands[2], bands[3]
+        ndvi = f_ndvi(red.astype(np.float64), nir.astype(np.float64))
+
+        for out_dtype, reference in [('int16', np.trunc(ndvi * 1000)), ('uint8', np.trunc(ndvi * 125 + 125)),
+                                     ('float32', ndvi.astype(np.float32))]:
+            with self.subTest(out_dtype=out_dtype):
+                quantized = f_ndvi_quantized(red, nir, out_dtype, mask=red == 0)
+                np.testing.assert_array_equal(quantized[:2, :2], get_output_dtype(out_dtype)['nodata'])
+                np.testing.assert_array_equal(quantized[2:, 2:], reference[2:, 2:])
+
+    def test_create_ndvi_image(self):
+        for size in SIZES:
+            with self.subTest(size=size):
+                bands = self.bands(size)
+                image = f"image_{size}.tif"
+                create_image(os.path.join(self.test_dir, image), bands)
+
+                _, duration, peak = measure(create_ndvi_image, image, self.test_dir, self.test_dir, f"ndvi_{size}.tif",
+                                            nir_band=3, red_band=2, in_nodata_value=0, out_nodata_value=-9999)
+
+                red, nir = bands[2].astype(np.float64), bands[3].astype(np.float64)
+                reference = np.where(red == 0, -9999, (nir - red) / np.where(red == 0, 1, nir + red))
+                output = gdal.Open(os.path.join(self.test_dir, f"ndvi_{size}.tif"))
+                self.assertEqual(output.GetRasterBand(1).DataType, gdal.GDT_Float32)
+                self.assertEqual(output.GetRasterBand(1).GetNoDataValue(), -9999)
+                np.testing.assert_allclose(output.ReadAsArray(), reference, rtol=1e-6)
+
+                self.check_performance('create_ndvi_image', size, duration, peak)
+
+    def test_create_ndvi_image_rescaled(self):
+        bands = self.bands(64)
+        create_image(os.path.join(self.test_dir, 'image_rescale.tif'), bands)
+
+        create_ndvi_image('image_rescale.tif', self.test_dir, self.test_dir, 'ndvi_rescale.tif', nir_band=3, red_band=2,
+                          rescale=True, range1=(-1, 1), range2=(0, 255), gdal_dtype=gdal.GDT_Byte)
+
+        red, nir = bands[2, 2:, 2:].astype(np.float64), bands[3, 2:, 2:].astype(np.float64)
+        reference = ((nir - red) / (nir + red) + 1) * 127.5
+        output = gdal.Open(os.path.join(self.test_dir, 'ndvi_rescale.tif')).ReadAsArray()
+        np.testing.assert_allclose(output[2:, 2:], reference, atol=1)
+
+    def test_create_ndvi_image_out_dtype(self):
+        bands = self.bands(64)
+        create_image(os.path.join(self.test_dir, 'image_out_dtype.tif'), bands)
+        red, nir = bands[2].astype(np.float64), bands[3].astype(np.float64)
+        ndvi = (nir - red) / np.where(red == 0, 1, nir + red)
+
+        for out_dtype, gdal_dtype, nodata, reference in [('int16', gdal.GDT_Int16, -32768, np.trunc(ndvi * 1000)),
+                                                         ('uint8', gdal.GDT_Byte, 255, np.trunc(ndvi * 125 + 125))]:
+            with self.subTest(out_dtype=out_dtype):
+                create_ndvi_image('image_out_dtype.tif', self.test_dir, self.test_dir, f"ndvi_{out_dtype}.tif", nir_band=3, red_band=2,
+                                  in_nodata_value=0, out_dtype=out_dtype)
+
+                band = gdal.Open(os.path.join(self.test_dir, f"ndvi_{out_dtype}.tif")).GetRasterBand(1)
+                self.assertEqual(band.DataType, gdal_dtype)
+                self.assertEqual(band.GetNoDataValue(), nodata)
+                self.assertIsNotNone(band.GetScale())
+                output = band.ReadAsArray()
+                np.testing.assert_array_equal(output[:2, :2], nodata)
+                np.testing.assert_array_equal(output[2:, 2:], reference[2:, 2:])
+
+
+if __name__ == '__main__':
+    unittest.main()
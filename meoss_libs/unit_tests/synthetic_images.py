@@ -0,0 +1,34 @@
+import numpy as np
+from osgeo import gdal
+
+from meoss_libs.quantization import get_output_dtype
+
+
+def create_image(filename, array, pixel_size=10, gdal_dtype=gdal.GDT_UInt16, nodata=None, scale=None):
+    """
+    write a GeoTIFF in EPSG:32631 with its upper left corner at (300000, 4800000), from a (lines, columns) array (single
+    band) or a (bands, lines, columns) array
+    """
+    bands = array[np.newaxis] if array.ndim == 2 else array
+
+    data_set = gdal.GetDriverByName('GTiff').Create(filename, bands.shape[2], bands.shape[1], bands.shape[0], gdal_dtype)
+    data_set.SetGeoTransform([300000, pixel_size, 0, 4800000, 0, -pixel_size])
+    srs = gdal.osr.SpatialReference()
+    srs.ImportFromEPSG(32631)
+    data_set.SetProjection(srs.ExportToWkt())
+    for idx_band in range(bands.shape[0]):
+        band = data_set.GetRasterBand(idx_band + 1)
+        if nodata is not None:
+            band.SetNoDataValue(nodata)
+        if scale is not None:
+            band.SetScale(scale)
+        band.WriteArray(bands[idx_band])
+    data_set = None
+
+
+def create_ndvi(filename, array, out_dtype='int16'):
+    """
+    write a NDVI GeoTIFF as written by the band mode (see meoss_libs.quantization), e.g. int16 NDVI x 1000
+    """
+    spec = get_output_dtype(out_dtype)
+    create_image(filename, array, gdal_dtype=gdal.GetDataTypeByName(spec['gdal']), nodata=spec['nodata'], scale=spec['scale'])
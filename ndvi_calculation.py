@@ -3,14 +3,21 @@
 import argparse
 import logging
 import os
+from functools import partial
 from sys import path
 
-import otbApplication
-
 # meoss_libs can be set to git submodule
 # and therefore be pull/push for other people/script independently of NVDI calculations
-from meoss_libs.file_management import search_B4_B8, generate_output_file_name, list_files
-from meoss_libs.otb import bandmath_otb, superimpose_otb, managenodata_otb, extract_ROI_otb, radiometric_indices_otb
+from meoss_libs.file_management import search_B4_B8, generate_output_file_name, list_files, group_by_date, generate_mosaic_file_name, parse_output_file_name, \
+    group_by_tile, generate_change_file_name
+from meoss_libs.log_config import setup_logging, setup_worker_logging, log_context
+from meoss_libs.otb import bandmath_otb, superimpose_otb, managenodata_otb, extract_ROI_otb, radiometric_indices_otb, concatenate_images_otb, OtbApplicationPool
+from meoss_libs.quantization import get_output_dtype, bandmath_quantization_expression, write_quantization_metadata, OUTPUT_DTYPES, INPUT_NODATA
+from meoss_libs.scheduler import CostHistory, ScheduledScene, physical_memory, run_scheduled, scene_pixels, SCENE_CREATED, SCENE_SKIPPED, SCENE_FAILED
+
+# heavy libraries (otbApplication, gdal, numpy) are only loaded by the backend actually used:
+# meoss_libs.otb imports otbApplication inside its functions and meoss_libs.numpy_backend is imported on demand.
+# This keeps -h and --dry-run runs near-instant.
 
 # Not sure to understand well the purpose of this part, really usefully ?
 # Path to personal libraries
@@ -18,23 +25,206 @@ scripts_folder = os.path.dirname(os.path.realpath(__file__))
 scripts_folder = os.path.normcase(scripts_folder)
 path.append(scripts_folder)
 
-# create logger
+# create logger, handlers and levels of all the loggers are set by setup_logging in the main
 logger = logging.getLogger('NDVI calculation')
-ch = logging.StreamHandler()
-ch.setLevel(logging.DEBUG)
-formatter = logging.Formatter('%(asctime)s (%(levelname)s) %(name)s(l%(lineno)d): %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
-ch.setFormatter(formatter)
-logger.addHandler(ch)
 
-# set logger level
-logging.getLogger('NDVI calculation').setLevel(logging.INFO)
-logging.getLogger('FILE MANAGEMENT').setLevel(logging.INFO)
+
+def band_output_file(red_band_img, img_format, output_directory):
+    """
+    Absolute path of the NDVI image produced in band mode from a red band image.
+    """
+    return os.path.join(output_directory, generate_output_file_name(red_band_img, img_format, prefix='NDVI'))
+
+
+def concatenated_output_file(file, output_directory, img_format='S2-2A'):
+    """
+    Absolute path of the NDVI image produced in concatenated mode from a concatenated image, or from the list of band
+    images stacked virtually (named after the first one, same name as the image produced from their concatenation).
+    """
+    if isinstance(file, (list, tuple)):
+        file = file[0]
+    return os.path.join(output_directory, generate_output_file_name(file, format=img_format, prefix='NDVI', prefix2='concatBGRPIP'))
+
+
+def write_otb_preview(outfile_with_path, quicklook_format):
+    """
+    Write the preview and quick-look of an image produced by OTB. OTB streams its blocks internally, the image is
+    therefore read back (once, by blocks) right after being written: from the CLI, this extra read must be requested
+    with --preview-reread.
+    """
+    from meoss_libs.preview import write_preview_from_file
+
+    preview_file, quicklook_file = write_preview_from_file(outfile_with_path, quicklook_format=quicklook_format)
+    logger.info(f'Preview files created: {preview_file}, {quicklook_file}')
+
+
+def append_datacube(outfile_with_path):
+    """
+    Append a NDVI image in the zarr datacube of its tile (created on first append), next to the image.
+    """
+    try:
+        from meoss_libs.datacube import append_to_datacube
+
+        if not os.path.exists(outfile_with_path):
+            logger.warning(f'File {outfile_with_path} not found, it has not been appended to the datacube')
+            return
+
+        path, index = append_to_datacube(outfile_with_path)
+        if index is not None:
+            logger.info(f'NDVI File {outfile_with_path} appended to datacube {path} (time index {index})')
+
+    except ImportError as e:
+        logger.error(f"zarr is needed for the datacube output: {e}")
+
+    except Exception as e:
+        logger.error(f"error while appending to the datacube: {e}")
+
+
+def log_dry_run(inputs, outfile_with_path):
+    """
+    Log the planned processing of a scene without loading any processing library.
+
+    Args:
+        inputs: list of the input images of the scene.
+        outfile_with_path: Absolute path of the output image.
+    """
+    status = 'skipped, already exists' if os.path.exists(outfile_with_path) else 'to be created'
+    logger.info(f"[dry-run] {', '.join(inputs)} -> {outfile_with_path} ({status})")
+
+
+def scene_context(mode, input_file, outfile_with_path):
+    """
+    Logging context of a scene: every message logged while processing the scene carries the mode, the scene name and,
+    when they can be read from the output file name, the tile and the date.
+    """
+    fields = {'mode': mode, 'scene': os.path.splitext(os.path.basename(input_file))[0]}
+    name = parse_output_file_name(outfile_with_path)
+    if name is not None:
+        fields.update(tile=name['tile'], date=name['date'])
+
+    return log_context(**fields)
 
 
-def ndvi_calculation_band(img_format, nir_band_img, red_band_img, cloud_mask_img, output_directory, shape_file):
+def pool_application(pool, key, name):
+    """
+    Return the application of the pool for key, or None (a new application will be created by the wrapper) without pool.
+    """
+    return pool.get(key, name) if pool is not None else None
+
+
+# otb applications of the current process, created once and reused for all its scenes:
+# with --workers, each worker process reuses its own applications
+WORKER_POOL = OtbApplicationPool()
+
+
+def run_band_scene(args, red_band_img, nir_band_img, cloud_mask_img):
+    """
+    Band mode of a scene (and its datacube append), run in the main process or in a worker process.
+
+    Args:
+        args: parsed command line arguments.
+        red_band_img, nir_band_img, cloud_mask_img: Absolute paths to the images of the scene.
+
+    Returns:
+        str: status of the scene, see ndvi_calculation_band.
+    """
+    outfile_with_path = band_output_file(red_band_img, args.format, args.output_dir)
+
+    with scene_context('band', red_band_img, outfile_with_path):
+        status = ndvi_calculation_band(args.format, nir_band_img, red_band_img, cloud_mask_img, args.output_dir, args.shape_directory, args.backend, args.threads, WORKER_POOL,
+                                       args.out_dtype or 'int16', args.preview, args.cloud_bits, args.valid_flags, args.mask_dilation)
+
+        # a skipped scene (output already there) was appended when it was computed
+        if args.datacube and status == SCENE_CREATED:
+            append_datacube(outfile_with_path)
+
+    return status
+
+
+def run_concat_scene(args, image, nir_band_nb, red_band_nb, img_format):
+    """
+    Concatenated mode of a scene (and its datacube append), run in the main process or in a worker process.
+
+    Args:
+        args: parsed command line arguments.
+        image: Absolute path to the concatenated image, or list of the band images of the scene.
+        nir_band_nb, red_band_nb: Position of the near infrared and red bands.
+        img_format: Images formats, used to name the output.
+
+    Returns:
+        str: status of the scene, see ndvi_calculation_concatenated.
+    """
+    inputs = image if isinstance(image, list) else [image]
+    outfile_with_path = concatenated_output_file(image, args.output_dir, img_format)
+
+    with scene_context('concat', inputs[0], outfile_with_path):
+        status = ndvi_calculation_concatenated(image, nir_band_nb, red_band_nb, args.output_dir, WORKER_POOL, args.out_dtype or 'float32', args.preview, img_format)
+
+        # a skipped scene (output already there) was appended when it was computed
+        if args.datacube and status == SCENE_CREATED:
+            append_datacube(outfile_with_path)
+
+    return status
+
+
+def run_scenes(args, scenes, log_queue=None, shape_file=None):
+    """
+    Run the scenes one after the other, or in args.workers worker processes with the adaptive scheduler: scenes are
+    ordered by estimated cost (pixels read from the image headers, AOI fraction, cost history of their format and backend), largest
+    first, and started only while the estimated memory of the running scenes stays under the memory budget.
+
+    Args:
+        args: parsed command line arguments.
+        scenes: list of (function, function arguments, format, reference image of the scene).
+        log_queue: logging queue returned by setup_logging, used by the worker processes.
+        shape_file: Absolute path to the shape file clipping the outputs, optional.
+    """
+    if not scenes:
+        return
+
+    if args.workers <= 1:
+        for function, function_args, _, _ in scenes:
+            function(*function_args)
+        return
+
+    # the cores are shared between the workers: each worker uses -t threads, cpu_count // workers without -t, in the
+    # numpy backend and in the OTB applications (environment inherited by the worker processes, unless already set)
+    threads = getattr(args, 'threads', None) or max(1, (os.cpu_count() or 1) // args.workers)
+    if hasattr(args, 'threads'):
+        args.threads = threads
+    os.environ.setdefault('ITK_GLOBAL_DEFAULT_NUMBER_OF_THREADS', str(threads))
+
+    history = CostHistory(args.cost_history or os.path.join(args.output_dir, '.ndvi_cost_history.json'))
+    if args.memory_budget:
+        memory_budget = args.memory_budget * 1e9
+    else:
+        memory = physical_memory()
+        memory_budget = 0.8 * memory if memory else None
+        if memory_budget is None:
+            logger.warning("physical memory unknown on this system, scenes are scheduled without memory budget (see --memory-budget)")
+
+    # costs are kept per format and backend, the concat mode only has the OTB backend
+    backend = getattr(args, 'backend', 'otb')
+
+    scheduled = []
+    for function, function_args, img_format, reference in scenes:
+        try:
+            pixels = scene_pixels(reference, shape_file)
+        except Exception as e:
+            # the scene is still processed (its own error, if any, is logged by the worker) with a default cost
+            logger.warning(f"size of {reference} can not be read, default cost estimate used: {e}")
+            pixels = None
+        scheduled.append(ScheduledScene(function, function_args, img_format, pixels, name=os.path.basename(reference), backend=backend))
+
+    logger.info(f"{len(scheduled)} scene(s) scheduled on {args.workers} workers of {threads} thread(s), memory budget {f'{memory_budget / 1e9:.1f} GB' if memory_budget else 'none'}")
+    run_scheduled(scheduled, args.workers, memory_budget, history, initializer=setup_worker_logging, initargs=(log_queue, args.log_level))
+
+
+def ndvi_calculation_band(img_format, nir_band_img, red_band_img, cloud_mask_img, output_directory, shape_file, backend='otb', threads=None, pool=None, out_dtype='int16', preview=None,
+                          cloud_bits=None, valid_flags=None, mask_dilation=0):
     """
     Function to produce very high resolution vegetation maps (NDVI) from satellite images, in urban areas.
-    Computation done with OTB and use B4 and B8 bands
+    Computation done with OTB (or numpy) and use B4 and B8 bands
 
     Args:
         img_format: Images formats. It can be: S2-2A-ESA, S2-2A, S2-3A.
@@ -43,77 +233,215 @@ def ndvi_calculation_band(img_format, nir_band_img, red_band_img, cloud_mask_img
         cloud_mask_img: Absolute path to the cloud mask image.
         output_directory: Absolute path to the output directory.
         shape_file: Absolute path to the shape file to clip the output computed index.
+        backend: Computation engine. It can be: otb, numpy. Default to otb.
+        threads: Number of threads used by the numpy backend, default to the number of CPU.
+        pool: OtbApplicationPool from which otb applications are reused between scenes, optional.
+        out_dtype: Output data type. It can be: int16 (NDVI x 1000), uint8, float32. Default to int16.
+        preview: Quick-look format of the 60 m preview written next to the NDVI image. It can be: png, jpeg. No preview if None.
+        cloud_bits: MAJA CLM bits flagging cloudy pixels (S2-2A), numpy backend only. Default to all bits (CLM != 0).
+        valid_flags: WASP FLG values of valid pixels (S2-3A), numpy backend only. Default to land (FLG == 4).
+        mask_dilation: Dilation of the cloudy pixels in pixels, numpy backend only. Default to 0 (no dilation).
 
     Returns:
-        None. The NDVI image is written in the output directory
+        str: SCENE_CREATED when the NDVI image is written in the output directory, SCENE_SKIPPED when it already
+            exists, SCENE_FAILED on error.
     """
     try:
         logger.info(f"generate ndvi image with B4 B8 band images")
-        logger.debug(f"files used : format: {img_format}, nir image: {nir_band_img}, red image: {red_band_img}, cloud image: {cloud_mask_img}, output dir: {output_directory}, shape file : {shape_file}")
+        logger.debug("files used : format: %s, nir image: %s, red image: %s, cloud image: %s, output dir: %s, shape file : %s", img_format, nir_band_img, red_band_img, cloud_mask_img, output_directory, shape_file)
 
-        outfile = generate_output_file_name(red_band_img, img_format, prefix='NDVI')
-        outfile_with_path = os.path.join(output_directory, outfile)
+        outfile_with_path = band_output_file(red_band_img, img_format, output_directory)
 
         if os.path.exists(outfile_with_path):
             logger.warning(f'File {outfile_with_path} already exists, it has not been created again')
+            return SCENE_SKIPPED
 
         else:
             cloud_free_mask_value = "0"            # cloud free value in S2-2A and S2-SEN2COR masks = 0
             if img_format == 'S2-3A':
                 cloud_free_mask_value = "4"        # cloud free value in S2-3A  = 4
 
-            # the sentinel-2 from ESA (S2-SEN2COR) only provides 20 m cloud mask, this why it's necessary to do superimpose.
-            app0 = superimpose_otb(cloud_mask_img, nir_band_img, "temp0.tif" )
+            decode_mask = cloud_bits is not None or valid_flags is not None
+
+            if backend == 'numpy':
+                from meoss_libs.cloud_mask import decode_cloud_mask
+                from meoss_libs.numpy_backend import ndvi_band_numpy
 
-            app1 = bandmath_otb(il=[nir_band_img, red_band_img], output_file="temp1.tif", exp="(im1b1-im2b1)/(im1b1+im2b1+1.E-6)*1000")
-            app2 = bandmath_otb(il_object=[app1.GetParameterOutputImage("out"), app0.GetParameterOutputImage("out")], output_file="temp2.tif", exp=f"(im2b1=={cloud_free_mask_value})?im1b1:0")
+                mask_decoder = partial(decode_cloud_mask, img_format=img_format, cloud_bits=cloud_bits, valid_flags=valid_flags) if decode_mask else None
+                ndvi_band_numpy(nir_band_img, red_band_img, cloud_mask_img, outfile_with_path, cloud_free_mask_value=int(cloud_free_mask_value),
+                                shape_file=shape_file, threads=threads, out_dtype=out_dtype, preview=preview,
+                                mask_decoder=mask_decoder, mask_dilation=mask_dilation)
 
-            # if shapefile is provided, it will be used to clip spectral index to the output image, else image is directly written
-            if shape_file:
-                logger.info(f"shape file used: {shape_file}")
-                app3 = managenodata_otb(input_image=app2.GetParameterOutputImage("out"), output_image="temp3.tif", action='exe')
-                extract_ROI_otb(input_file= app3.GetParameterOutputImage("out"), shape_file=shape_file, output_file=f"{outfile_with_path}?gdal:co:COMPRESS=DEFLATE&gdal:co:BIGTIFF=YES")
+            elif decode_mask or mask_dilation:
+                raise ValueError("cloud mask bits, flags and dilation are only available with the numpy backend")
 
             else:
-                managenodata_otb(input_image=app2.GetParameterOutputImage("out"), output_image=f"{outfile_with_path}?gdal:co:COMPRESS=DEFLATE&gdal:co:BIGTIFF=YES", action='write&exe')
+                # the quantization to out_dtype is fused in the NDVI expression, pixels with input nodata reflectances and
+                # masked pixels are set to the nodata value
+                out_spec = get_output_dtype(out_dtype)
+                ndvi_expression = bandmath_quantization_expression("(im1b1-im2b1)/(im1b1+im2b1+1.E-6)", out_dtype)
+
+                # the sentinel-2 from ESA (S2-SEN2COR) only provides 20 m cloud mask, this why it's necessary to do superimpose.
+                app0 = superimpose_otb(cloud_mask_img, nir_band_img, "temp0.tif", app=pool_application(pool, "superimpose", "Superimpose"))
+
+                app1 = bandmath_otb(il=[nir_band_img, red_band_img], output_file="temp1.tif", exp=f"(im1b1<={INPUT_NODATA} || im2b1<={INPUT_NODATA})?{out_spec['nodata']}:{ndvi_expression}",
+                                    app=pool_application(pool, "ndvi", "BandMath"))
+                app2 = bandmath_otb(il_object=[app1.GetParameterOutputImage("out"), app0.GetParameterOutputImage("out")], output_file="temp2.tif", exp=f"(im2b1=={cloud_free_mask_value})?im1b1:{out_spec['nodata']}",
+                                    app=pool_application(pool, "cloud_mask", "BandMath"))
+
+                # if shapefile is provided, it will be used to clip spectral index to the output image, else image is directly written
+                if shape_file:
+                    logger.info(f"shape file used: {shape_file}")
+                    app3 = managenodata_otb(input_image=app2.GetParameterOutputImage("out"), output_image="temp3.tif", action='exe', out_pixel_type=out_spec['otb'], app=pool_application(pool, "nodata", "ManageNoData"))
+                    extract_ROI_otb(input_file= app3.GetParameterOutputImage("out"), shape_file=shape_file, output_file=f"{outfile_with_path}?gdal:co:COMPRESS=DEFLATE&gdal:co:BIGTIFF=YES",
+                                    out_pixel_type=out_spec['otb'], app=pool_application(pool, "clip", "ExtractROI"))
+
+                else:
+                    managenodata_otb(input_image=app2.GetParameterOutputImage("out"), output_image=f"{outfile_with_path}?gdal:co:COMPRESS=DEFLATE&gdal:co:BIGTIFF=YES", action='write&exe',
+                                     out_pixel_type=out_spec['otb'], app=pool_application(pool, "nodata", "ManageNoData"))
+
+                # scale, offset and nodata are written in the metadata of the product, pixels are not read again
+                write_quantization_metadata(outfile_with_path, out_dtype)
+
+                if preview:
+                    write_otb_preview(outfile_with_path, preview)
 
             logger.info(f'NDVI File created: {outfile_with_path}')
+            return SCENE_CREATED
 
     except Exception as e:
         logger.error(f"error while generating NDVI image: {e}")
+        return SCENE_FAILED
 
 
-def ndvi_calculation_concatenated(file, nir_band_nb, red_band_nb, output_directory):
+def ndvi_calculation_concatenated(file, nir_band_nb, red_band_nb, output_directory, pool=None, out_dtype='float32', preview=None, img_format='S2-2A'):
     """
     Function to produce very high resolution vegetation maps (NDVI) from satellite images, in urban areas.
-    Computation done with OTB and BGRPIP concatenated image
+    Computation done with OTB and BGRPIP concatenated image, or single band images stacked on the fly
+    (in memory OTB ConcatenateImages, no concatenated copy of the bands is written).
 
     Args:
-        file: Absolute path to the concatenated image.
-        nir_band_nb: Position of the near infrared bands in the images (1 for the first band).
-        red_band_nb: Position of the red bands in the images (1 for the first band).
+        file: Absolute path to the concatenated image, or list of absolute paths to single band images of the same grid.
+        nir_band_nb: Position of the near infrared bands in the images (1 for the first band), or in the list of images.
+        red_band_nb: Position of the red bands in the images (1 for the first band), or in the list of images.
         output_directory: Absolute path to the output directory.
+        pool: OtbApplicationPool from which otb applications are reused between scenes, optional.
+        out_dtype: Output data type. It can be: float32, int16 (NDVI x 1000), uint8. Default to float32.
+        preview: Quick-look format of the 60 m preview written next to the NDVI image. It can be: png, jpeg. No preview if None.
+        img_format: Images formats, used to name the output. It can be: S2-2A-ESA, S2-2A, S2-3A. Default to S2-2A.
 
     Returns:
-        None. The NDVI image is written in the output directory
+        str: SCENE_CREATED when the NDVI image is written in the output directory, SCENE_SKIPPED when it already
+            exists, SCENE_FAILED on error.
     """
     try:
         logger.info(f"generate ndvi image with concatenated images in {file}")
-        logger.debug(f"files used : file: {file}, nir nb: {nir_band_nb}, red nb: {nir_band_nb}, output dir: {output_directory}")
+        logger.debug("files used : file: %s, nir nb: %s, red nb: %s, output dir: %s", file, nir_band_nb, red_band_nb, output_directory)
 
-        outfile = generate_output_file_name(file, format='S2-2A', prefix='NDVI', prefix2='concatBGRPIP')
-        outfile_with_path = os.path.join(output_directory, outfile)
+        outfile_with_path = concatenated_output_file(file, output_directory, img_format)
 
-        if os.path.exists(os.path.join(output_directory, outfile)):
+        if os.path.exists(outfile_with_path):
             logger.warning(f'File {outfile_with_path} already exists, it has not been created again')
+            return SCENE_SKIPPED
 
         else:
-            radiometric_indices_otb(file, outfile_with_path, nir_band_nb, red_band_nb)
+            if isinstance(file, (list, tuple)):
+                # virtual stack of the band images, streamed by blocks into RadiometricIndices
+                stack = concatenate_images_otb(il=file, app=pool_application(pool, "stack", "ConcatenateImages"))
+                image = stack.GetParameterOutputImage("out")
+            else:
+                image = file
+
+            if out_dtype == 'float32':
+                radiometric_indices_otb(image, outfile_with_path, nir_band_nb, red_band_nb, app=pool_application(pool, "ndvi", "RadiometricIndices"))
+
+            else:
+                # the NDVI is quantized in memory before being written, the float image is never written
+                app0 = radiometric_indices_otb(image, "temp0.tif", nir_band_nb, red_band_nb, action='exe', app=pool_application(pool, "ndvi", "RadiometricIndices"))
+                app1 = bandmath_otb(il_object=[app0.GetParameterOutputImage("out")], output_file="temp1.tif", exp=bandmath_quantization_expression("im1b1", out_dtype),
+                                    app=pool_application(pool, "quantization", "BandMath"))
+                managenodata_otb(input_image=app1.GetParameterOutputImage("out"), output_image=outfile_with_path, action='write&exe',
+                                 out_pixel_type=get_output_dtype(out_dtype)['otb'], app=pool_application(pool, "nodata", "ManageNoData"))
+
+            write_quantization_metadata(outfile_with_path, out_dtype)
+
+            if preview:
+                write_otb_preview(outfile_with_path, preview)
 
             logger.info(f'NDVI File created: {outfile_with_path}')
+            return SCENE_CREATED
 
     except Exception as e:
         logger.error(f"error while generating NDVI image: {e}")
+        return SCENE_FAILED
+
+
+def ndvi_mosaic(files, outfile_with_path, overlap, shape_file, threads=None):
+    """
+    Function to mosaic the NDVI images of a date computed on several tiles (e.g. an AOI straddling tiles boundaries).
+    Computation done with GDAL and numpy, by blocks streamed through a VRT index.
+
+    Args:
+        files: Absolute paths to the NDVI images of the same date.
+        outfile_with_path: Absolute path to the output mosaic.
+        overlap: Value kept where images overlap. It can be: max (maximum NDVI), first (first valid value).
+        shape_file: Absolute path to the shape file to clip the mosaic.
+        threads: Number of threads, default to the number of CPU.
+
+    Returns:
+        None. The mosaic is written in outfile_with_path
+    """
+    try:
+        logger.info(f"generate mosaic of {len(files)} NDVI images")
+        logger.debug("files used : files: %s, overlap: %s, shape file : %s", files, overlap, shape_file)
+
+        if os.path.exists(outfile_with_path):
+            logger.warning(f'File {outfile_with_path} already exists, it has not been created again')
+
+        else:
+            from meoss_libs.mosaic import mosaic_ndvi
+
+            mosaic_ndvi(files, outfile_with_path, overlap=overlap, shape_file=shape_file, threads=threads)
+
+            logger.info(f'Mosaic File created: {outfile_with_path}')
+
+    except Exception as e:
+        logger.error(f"error while generating mosaic image: {e}")
+
+
+def ndvi_change_detection(source1, source2, delta_file, change_file, threshold=0.2, img_format=None, threads=None):
+    """
+    Function to detect vegetation changes (e.g. vegetation loss in urban areas) of a tile between two dates.
+    Computation done with GDAL and numpy, both dates are streamed by blocks in a single pass.
+
+    Args:
+        source1: NDVI image of the first date, or (nir band, red band, cloud mask) images to compute it on the fly.
+        source2: NDVI image of the second date, or (nir band, red band, cloud mask) images to compute it on the fly.
+        delta_file: Absolute path to the delta NDVI image (NDVI2 - NDVI1 x 1000, int16).
+        change_file: Absolute path to the change mask (0 = no change, 1 = loss, 2 = gain, 255 = masked at one of the dates).
+        threshold: Minimum absolute NDVI difference flagged as a change. Default to 0.2.
+        img_format: Images formats of the band images. It can be: S2-2A-ESA, S2-2A, S2-3A.
+        threads: Number of threads, default to the number of CPU.
+
+    Returns:
+        None. The delta NDVI and the change mask are written in delta_file and change_file
+    """
+    try:
+        logger.info(f"generate NDVI change between two dates, threshold {threshold}")
+        logger.debug("files used : first date: %s, second date: %s, format: %s", source1, source2, img_format)
+
+        if os.path.exists(delta_file) and os.path.exists(change_file):
+            logger.warning(f'Files {delta_file} and {change_file} already exist, they have not been created again')
+
+        else:
+            from meoss_libs.change_detection import ndvi_change
+
+            ndvi_change(source1, source2, delta_file, change_file, threshold=threshold, img_format=img_format, threads=threads)
+
+            logger.info(f'Change Files created: {delta_file}, {change_file}')
+
+    except Exception as e:
+        logger.error(f"error while generating NDVI change images: {e}")
 
 
 if __name__ == "__main__":
@@ -123,21 +451,69 @@ if __name__ == "__main__":
 
     parser.add_argument('-i', '--input-directory',  dest='input_dir', default=os.path.join(os.getcwd(), '01_DATA'), help='Input images file directory.')
     parser.add_argument('-o', '--output-directory', dest='output_dir', default=os.path.join(os.getcwd(), '02_RES'), help='Output images file directory.')
+    parser.add_argument('-dt', '--out-dtype', choices=list(OUTPUT_DTYPES), required=False, dest='out_dtype', help='[Optional] output data type, scale, offset and nodata are written in the image metadata. default to int16 (NDVI x 1000) in band mode and float32 in concat mode')
+    parser.add_argument('-pv', '--preview', choices=['png', 'jpeg'], required=False, dest='preview', help='[Optional] also write a 60 m preview (GeoTIFF) and a colour mapped quick-look in this format next to each NDVI image')
+    parser.add_argument('-pr', '--preview-reread', action='store_true', dest='preview_reread', help='[Optional] allow --preview for the images produced by OTB (band mode with --backend otb, concat mode): OTB does not expose its blocks, each NDVI image is then read again once written to build its preview')
+    parser.add_argument('-dc', '--datacube', action='store_true', dest='datacube', help='[Optional] also append each NDVI image to the chunked zarr datacube of its tile (<prefix>_<tile>_CUBE.zarr), for time series analysis')
+    parser.add_argument('-n', '--dry-run', action='store_true', dest='dry_run', help='Only list the planned scenes and outputs, nothing is computed nor written.')
+    parser.add_argument('-w', '--workers', type=int, default=1, dest='workers', help='Number of scenes processed in parallel (band and concat modes), in worker processes scheduled largest first within the memory budget')
+    parser.add_argument('-mb', '--memory-budget', type=float, required=False, dest='memory_budget', help='[Optional] with --workers, maximum estimated memory (GB) of the scenes running together, default to 80%% of the physical memory')
+    parser.add_argument('--cost-history', required=False, dest='cost_history', help='[Optional] JSON file of the measured cost of the scenes per format and backend, used to estimate the next ones. default to .ndvi_cost_history.json in the output directory')
+    parser.add_argument('-ll', '--log-level', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], default='INFO', dest='log_level', help='Logging level.')
+    parser.add_argument('-lf', '--log-format', choices=['text', 'json'], default='text', dest='log_format', help='Logging format: text = human readable, json = one JSON object per line (with mode, scene, tile and date fields)')
+    parser.add_argument('--log-file', required=False, dest='log_file', help='[Optional] write the logs in this file instead of stderr')
 
     parser_concat = subparsers.add_parser('concat', help='options for concatenated mode')
     parser_concat.add_argument('-nb', '--nir-band-nb' ,  dest='nir_band_nb', default=4, help='Inform the position of the near infrared bands in the images (1 for the first band). default (4)')
     parser_concat.add_argument('-rb', '--red-band-nb',  dest='red_band_nb', default=3, help='Inform the position of the red bands in the images (1 for the first band). Default (3)')
-    parser_concat.add_argument('suffixes_name', type=str, nargs='+', help='Input images file suffixes (ex: *_FRE_ConcatenateImageBGRPIR)')
+    parser_concat.add_argument('-f', '--format', choices=['S2-2A', 'S2-2A-ESA', 'S2-3A'], required=False, dest='format', help='[Optional] use the B4 and B8 band images of this format, stacked on the fly, instead of concatenated images (no suffixes_name needed)')
+    parser_concat.add_argument('suffixes_name', type=str, nargs='*', help='Input images file suffixes (ex: *_FRE_ConcatenateImageBGRPIR)')
 
     parser_band = subparsers.add_parser('band', help='options for band mode')
     parser_band.add_argument('-f', '--format', choices=['S2-2A', 'S2-2A-ESA', 'S2-3A'], required=True, dest='format', help='Sentinel-2 level : S2-2A = image processed with MAJA, S2-3A = cloud free synthesis processed with WASP, S2-2A-ESA = image processed with SEN2COR')
     parser_band.add_argument('-shpdir', '--shapefile-directory', required=False, dest='shape_directory', help=' [Optional] shapefile (must have same CRS as input image) to clip the output computed index')
+    parser_band.add_argument('-b', '--backend', choices=['otb', 'numpy'], default='otb', dest='backend', help='Computation engine: otb = OTB applications, numpy = GDAL + numpy (numexpr if installed) blocked multi-threaded computation')
+    parser_band.add_argument('-t', '--threads', type=int, required=False, dest='threads', help='[Optional] number of threads used by the numpy backend, default to the number of CPU (divided by --workers)')
+    parser_band.add_argument('-cb', '--cloud-bits', type=int, nargs='+', choices=range(8), required=False, dest='cloud_bits', help='[Optional] S2-2A only, MAJA CLM bits flagging cloudy pixels (ex: 0 5 to ignore thin clouds), default to all bits. numpy backend only')
+    parser_band.add_argument('-vf', '--valid-flags', type=int, nargs='+', required=False, dest='valid_flags', help='[Optional] S2-3A only, WASP FLG values of valid pixels (ex: 3 4 to keep water), default to 4 (land). numpy backend only')
+    parser_band.add_argument('-md', '--mask-dilation', type=int, default=0, dest='mask_dilation', help='[Optional] dilate cloudy pixels by this number of pixels (cloud edges and shadows), default to 0. numpy backend only')
+
+    parser_mosaic = subparsers.add_parser('mosaic', help='options for mosaic mode')
+    parser_mosaic.add_argument('-ov', '--overlap', choices=['max', 'first'], default='max', dest='overlap', help='Value kept where tiles overlap: max = maximum NDVI, first = first valid value (tiles sorted by name)')
+    parser_mosaic.add_argument('-shpdir', '--shapefile-directory', required=False, dest='shape_directory', help=' [Optional] shapefile (must have same CRS as input images) to clip the mosaic')
+    parser_mosaic.add_argument('-t', '--threads', type=int, required=False, dest='threads', help='[Optional] number of threads, default to the number of CPU')
+    parser_mosaic.add_argument('suffixes_name', type=str, nargs='*', default=['NDVI_T*'], help='NDVI images file patterns, output of band or concat mode (ex: NDVI_T*)')
+
+    parser_change = subparsers.add_parser('change', help='options for change detection mode (delta NDVI between consecutive dates of each tile)')
+    parser_change.add_argument('-f', '--format', choices=['S2-2A', 'S2-2A-ESA', 'S2-3A'], required=False, dest='format', help='[Optional] compute the NDVI on the fly from the B4, B8 and cloud mask images of this format, instead of reading NDVI images')
+    parser_change.add_argument('-th', '--threshold', type=float, default=0.2, dest='threshold', help='Minimum absolute NDVI difference flagged as a change (loss or gain)')
+    parser_change.add_argument('-t', '--threads', type=int, required=False, dest='threads', help='[Optional] number of threads, default to the number of CPU')
+    parser_change.add_argument('suffixes_name', type=str, nargs='*', default=['NDVI_T*'], help='NDVI images file patterns, output of band or concat mode (ex: NDVI_T*), ignored with --format')
 
     args = parser.parse_args()
 
+    if args.mode == 'concat' and not args.format and not args.suffixes_name:
+        parser.error("concat mode needs suffixes_name (concatenated images) or --format (band images)")
+
+    if args.mode == 'band' and args.backend == 'otb' and (args.cloud_bits is not None or args.valid_flags is not None or args.mask_dilation):
+        parser.error("--cloud-bits, --valid-flags and --mask-dilation require --backend numpy")
+
+    # the CLM bits are those of the MAJA products, the FLG values those of the WASP syntheses
+    if args.mode == 'band' and args.cloud_bits is not None and args.format != 'S2-2A':
+        parser.error("--cloud-bits is only available with --format S2-2A (MAJA CLM mask)")
+
+    if args.mode == 'band' and args.valid_flags is not None and args.format != 'S2-3A':
+        parser.error("--valid-flags is only available with --format S2-3A (WASP FLG mask)")
+
+    if args.preview and not args.preview_reread and (args.mode == 'concat' or (args.mode == 'band' and args.backend == 'otb')):
+        parser.error("--preview with the OTB backend or the concat mode reads each NDVI image again, add --preview-reread to accept this extra read or use --backend numpy")
+
+    # records are written by a queue listener thread, processing threads and worker processes only enqueue them
+    log_queue = setup_logging(args.log_level, args.log_format, args.log_file, use_queue=True)
+
     # TODO: depending on the needs, but all needed arguments could be moved to a configuration file instead of being passed as arguments each time
 
-    if not os.path.isdir(args.output_dir):
+    if not args.dry_run and not os.path.isdir(args.output_dir):
         os.makedirs(args.output_dir, exist_ok=True)
 
     if args.mode == 'band':
@@ -146,14 +522,86 @@ if __name__ == "__main__":
         if len(band_files['B4']) == 0 and len(band_files['B8']) == 0:
             logger.warning("no B4 B8 files found")
 
+        scenes = []
         for red, nir, mask in zip(band_files['B4'], band_files['B8'], band_files['cloud_masks']):
-            ndvi_calculation_band(args.format, nir, red, mask, args.output_dir, args.shape_directory)
+            if args.dry_run:
+                with scene_context('band', red, band_output_file(red, args.format, args.output_dir)):
+                    log_dry_run([red, nir, mask], band_output_file(red, args.format, args.output_dir))
+                continue
+
+            scenes.append((run_band_scene, (args, red, nir, mask), args.format, nir))
+
+        run_scenes(args, scenes, log_queue, args.shape_directory)
 
     elif args.mode == 'concat':
-        files = list_files(pattern=args.suffixes_name, directory=args.input_dir, subfolder=True)
+        # (image or list of band images, nir band position, red band position)
+        if args.format:
+            band_files = search_B4_B8(args.input_dir, args.format, subfolder=True)
+            scenes = [([red, nir], 2, 1) for red, nir in zip(band_files['B4'], band_files['B8'])]
+        else:
+            scenes = [(image, args.nir_band_nb, args.red_band_nb) for image in list_files(pattern=args.suffixes_name, directory=args.input_dir, subfolder=True)]
+        img_format = args.format or 'S2-2A'
+
+        if len(scenes) == 0:
+            logger.warning("no concat BGRPIP files found" if not args.format else "no B4 B8 files found")
+
+        scheduled_scenes = []
+        for image, nir_band_nb, red_band_nb in scenes:
+            inputs = image if isinstance(image, list) else [image]
+
+            if args.dry_run:
+                with scene_context('concat', inputs[0], concatenated_output_file(image, args.output_dir, img_format)):
+                    log_dry_run(inputs, concatenated_output_file(image, args.output_dir, img_format))
+                continue
+
+            # the cost of the scene is estimated on its near infrared band, or on the concatenated image
+            scheduled_scenes.append((run_concat_scene, (args, image, nir_band_nb, red_band_nb, img_format), args.format or 'concat', inputs[-1]))
+
+        run_scenes(args, scheduled_scenes, log_queue)
+
+    elif args.mode == 'mosaic':
+        groups = group_by_date(list_files(pattern=args.suffixes_name, directory=args.input_dir, subfolder=True))
+
+        if len(groups) == 0:
+            logger.warning("no NDVI files found to mosaic")
+
+        # a date acquired on a single tile has nothing to mosaic, its NDVI is not copied
+        single_tile = [key for key, files in groups.items() if len(files) < 2]
+        for prefix, date, suffix in single_tile:
+            logger.info(f"{prefix} {date}{' ' + suffix if suffix else ''}: single tile, no mosaic")
+        groups = {key: files for key, files in groups.items() if len(files) >= 2}
+
+        for (prefix, date, suffix), files in groups.items():
+            outfile_with_path = os.path.join(args.output_dir, generate_mosaic_file_name(prefix, date, suffix))
+
+            with log_context(mode='mosaic', scene=os.path.splitext(os.path.basename(outfile_with_path))[0], date=date):
+                if args.dry_run:
+                    log_dry_run(files, outfile_with_path)
+                    continue
+
+                ndvi_mosaic(files, outfile_with_path, args.overlap, args.shape_directory, args.threads)
+
+    elif args.mode == 'change':
+        # scenes of each tile sorted by date, NDVI images or (nir, red, cloud mask) images named as their band mode output
+        if args.format:
+            band_files = search_B4_B8(args.input_dir, args.format, subfolder=True)
+            scenes = list(zip(band_files['B8'], band_files['B4'], band_files['cloud_masks']))
+            tiles = group_by_tile(scenes, [generate_output_file_name(red, args.format, prefix='NDVI') for _, red, _ in scenes])
+        else:
+            tiles = group_by_tile(list_files(pattern=args.suffixes_name, directory=args.input_dir, subfolder=True))
+
+        if not any(len(dates) > 1 for dates in tiles.values()):
+            logger.warning("no tile with at least two dates found")
+
+        for (prefix, tile, suffix), dates in tiles.items():
+            for (date1, source1), (date2, source2) in zip(dates[:-1], dates[1:]):
+                delta_file = os.path.join(args.output_dir, generate_change_file_name(f"DELTA_{prefix}", tile, date1, date2, suffix))
+                change_file = os.path.join(args.output_dir, generate_change_file_name(f"CHANGE_{prefix}", tile, date1, date2, suffix))
 
-        if len(files) == 0:
-            logger.warning("no concat BGRPIP files found")
+                with log_context(mode='change', scene=os.path.splitext(os.path.basename(delta_file))[0], tile=tile, date=date2):
+                    if args.dry_run:
+                        inputs = [source1, source2] if args.format is None else list(source1) + list(source2)
+                        log_dry_run(inputs, delta_file)
+                        continue
 
-        for image in files:
-            ndvi_calculation_concatenated(image, args.nir_band_nb, args.red_band_nb, args.output_dir)
+                    ndvi_change_detection(source1, source2, delta_file, change_file, args.threshold, args.format, args.threads)